@@ -0,0 +1,222 @@
+import itertools
+import threading
+import time
+
+
+class QueueFull(Exception):
+    """Raised when the admission queue has no room for another request"""
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a request was not admitted before its wait deadline"""
+
+    def __init__(self, position):
+        super().__init__(f"Not admitted in time (queue position {position})")
+        self.position = position
+
+
+def available_memory():
+    """Bytes of memory available to new work according to /proc/meminfo, or None"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def derive_capacity(render_slots, requests_per_slot=2, memory_per_request=None, max_workers=None, processes=1):
+    """
+    Number of requests worth running at once on this machine
+
+    Rendering is the scarce resource, so capacity starts from the number of
+    render slots; a request spends part of its time parsing and building
+    the workbook, so each slot is shared by `requests_per_slot` requests.
+    The result is capped by how many requests fit in the available memory
+    and by the number of worker threads.
+
+    Args:
+        render_slots: Browser render slots (usually the browser pool size)
+        requests_per_slot: Requests admitted per render slot
+        memory_per_request: Estimated peak memory of one request in bytes
+        max_workers: Threads available to run admitted requests
+        processes: Server processes sharing the machine's memory
+    """
+    capacity = render_slots * requests_per_slot
+    memory = available_memory()
+    if memory_per_request and memory is not None:
+        capacity = min(capacity, memory // processes // memory_per_request)
+    if max_workers:
+        capacity = min(capacity, max_workers)
+    return max(1, capacity)
+
+
+class Ticket:
+    """A request's place in the admission queue; release() once the work is done"""
+
+    def __init__(self, controller, size, seq):
+        self.size = size
+        self.seq = seq
+        self.enqueued_at = time.time()
+        self.admitted_at = None
+        self.initial_position = None
+        self._controller = controller
+        self._admitted = threading.Event()
+        self._callback = None
+        self._released = False
+
+    @property
+    def admitted(self):
+        return self._admitted.is_set()
+
+    @property
+    def position(self):
+        """1-based place among waiting requests, or 0 once admitted"""
+        return self._controller.position(self)
+
+    @property
+    def waited(self):
+        """Seconds spent in the queue so far"""
+        return (self.admitted_at or time.time()) - self.enqueued_at
+
+    def wait(self, timeout=None):
+        """Block until admitted; leaves the queue and raises AdmissionTimeout after `timeout` seconds"""
+        if self._admitted.wait(timeout):
+            return
+        position = self.position
+        if self._controller.withdraw(self):
+            raise AdmissionTimeout(position)
+
+    def on_admit(self, callback):
+        """Call `callback()` once admitted, from whichever thread admits the ticket"""
+        self._controller.set_callback(self, callback)
+
+    def release(self):
+        self._controller.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Bounded admission queue in front of the render pipeline
+
+    Up to `capacity` requests run at once; the rest wait in a queue of at
+    most `max_queue` entries instead of being rejected. Whenever a slot
+    frees, the waiting request with the smallest upload goes next, so small
+    reports are not stuck behind large ones. A request's effective size
+    shrinks by `aging_bytes_per_second` while it waits, so large uploads
+    are not starved by a steady stream of small ones.
+
+    Args:
+        capacity: Requests running at once, e.g. from derive_capacity()
+        max_queue: Requests allowed to wait for a slot
+        aging_bytes_per_second: Priority a waiting request gains per second
+    """
+
+    def __init__(self, capacity, max_queue=50, aging_bytes_per_second=1024 * 1024):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.aging_bytes_per_second = aging_bytes_per_second
+
+        self._running = set()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._admitted_total = 0
+        self._rejected_total = 0
+        self._timed_out_total = 0
+
+    def enter(self, size):
+        """
+        Join the queue with an upload of `size` bytes
+
+        The returned ticket is admitted immediately when a slot is free;
+        otherwise wait() on it or register an on_admit() callback.
+
+        Raises:
+            QueueFull: When `max_queue` requests are already waiting
+        """
+        with self._lock:
+            ticket = Ticket(self, size, next(self._seq))
+            if len(self._running) < self.capacity and not self._waiting:
+                ticket.initial_position = 0
+                self._admit(ticket)
+                return ticket
+            if len(self._waiting) >= self.max_queue:
+                self._rejected_total += 1
+                raise QueueFull(f"Admission queue is full ({self.max_queue} waiting)")
+            self._waiting.append(ticket)
+            ticket.initial_position = self._position(ticket)
+            return ticket
+
+    def position(self, ticket):
+        with self._lock:
+            return self._position(ticket)
+
+    def withdraw(self, ticket):
+        """Take a waiting ticket out of the queue; False if it was admitted meanwhile"""
+        with self._lock:
+            if ticket.admitted:
+                return False
+            self._waiting.remove(ticket)
+            self._timed_out_total += 1
+            return True
+
+    def set_callback(self, ticket, callback):
+        with self._lock:
+            if not ticket.admitted:
+                ticket._callback = callback
+                return
+        callback()
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket._released or ticket not in self._running:
+                return
+            ticket._released = True
+            self._running.discard(ticket)
+            admitted = []
+            while self._waiting and len(self._running) < self.capacity:
+                next_ticket = min(self._waiting, key=self._priority)
+                self._waiting.remove(next_ticket)
+                self._admit(next_ticket)
+                admitted.append(next_ticket)
+        for next_ticket in admitted:
+            if next_ticket._callback is not None:
+                next_ticket._callback()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'running': len(self._running),
+                'queued': len(self._waiting),
+                'max_queue': self.max_queue,
+                'admitted': self._admitted_total,
+                'rejected': self._rejected_total,
+                'timed_out': self._timed_out_total
+            }
+
+    def _admit(self, ticket):
+        ticket.admitted_at = time.time()
+        self._running.add(ticket)
+        self._admitted_total += 1
+        ticket._admitted.set()
+
+    def _priority(self, ticket, now=None):
+        waited = (now or time.time()) - ticket.enqueued_at
+        return (ticket.size - waited * self.aging_bytes_per_second, ticket.seq)
+
+    def _position(self, ticket):
+        if ticket.admitted:
+            return 0
+        now = time.time()
+        priority = self._priority(ticket, now)
+        return 1 + sum(1 for other in self._waiting if self._priority(other, now) < priority)
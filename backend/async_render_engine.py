@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import threading
+import time
+
+from playwright.async_api import async_playwright
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRenderEngine:
+    """
+    Pages of a few headless Chromium browsers multiplexed on one event loop.
+
+    Playwright's async API runs on a dedicated thread with its own event
+    loop, so one browser serves many pages at once and concurrency is bounded
+    by `max_pages` rather than by the number of threads. Jobs are coroutine
+    functions that receive a fresh, isolated BrowserContext; the context is
+    closed once the job is done. submit() can be called from any thread and
+    returns a concurrent.futures.Future, like BrowserPool.submit().
+
+    Args:
+        browsers: Number of browser processes pages are spread over
+        max_pages: Pages (one context each) rendering at once across all browsers
+        max_jobs_per_browser: Retire a browser after this many jobs
+        health_check_interval: Seconds between liveness checks
+        launch_options: Extra keyword arguments for chromium.launch()
+        context_options: Extra keyword arguments for browser.new_context()
+
+    Set `acquire_observer` to a callable(seconds) to be told how long each
+    job waited for its page, from submit() until its context was ready.
+    """
+
+    # Jobs submitted to this engine must be coroutine functions
+    asynchronous = True
+
+    def __init__(self, browsers=1, max_pages=16, max_jobs_per_browser=200, health_check_interval=30,
+                 launch_options=None, context_options=None):
+        self.browsers = browsers
+        self.max_pages = max_pages
+        self.max_jobs_per_browser = max_jobs_per_browser
+        self.health_check_interval = health_check_interval
+        self.launch_options = {'headless': True, **(launch_options or {})}
+        self.context_options = context_options or {}
+        self.acquire_observer = None
+
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._startup_error = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._busy = 0
+        self._queued = 0
+        self._launches = 0
+        self._restarts = 0
+        self._completed = 0
+        self._failed = 0
+
+        # Only touched on the event loop
+        self._playwright = None
+        self._slots = []  # [browser, jobs served] per browser
+        self._active = {}  # browser -> pages currently open on it
+        self._next_slot = 0
+        self._tasks = set()
+
+    def start(self):
+        """Start the event loop thread and launch the browsers"""
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError("Render engine has been shut down")
+            if self._started:
+                return
+            self._ready.clear()
+            self._startup_error = None
+            self._thread = threading.Thread(target=self._thread_main, name="render-engine", daemon=True)
+            self._thread.start()
+            self._ready.wait()
+            if self._startup_error is not None:
+                raise RuntimeError(f"Render engine failed to start: {self._startup_error}")
+            self._started = True
+        logger.info(f"Render engine started with {self.browsers} browsers, {self.max_pages} pages")
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule `await fn(context, *args, **kwargs)` on the next free page and return a Future
+
+        Raises RuntimeError once the engine has been shut down, rather than launching new browsers.
+        """
+        self.start()
+        with self._lock:
+            self._queued += 1
+        return asyncio.run_coroutine_threadsafe(self._run_job(fn, args, kwargs, time.monotonic()), self._loop)
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Run a job and wait for its result"""
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    def shutdown(self, wait=True):
+        """Close every browser, after the running jobs finish when `wait` is set; the engine cannot be started again"""
+        with self._start_lock:
+            self._closed = True
+            if not self._started:
+                return
+            self._started = False
+        asyncio.run_coroutine_threadsafe(self._close(wait), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        logger.info("Render engine shut down")
+
+    def stats(self):
+        """Snapshot of page occupancy and lifetime counters"""
+        with self._lock:
+            return {
+                'engine': 'async',
+                'size': self.browsers,
+                'max_pages': self.max_pages,
+                'busy': self._busy,
+                'idle': max(0, self.max_pages - self._busy),
+                'queued': self._queued,
+                'browsers_launched': self._launches,
+                'browser_restarts': self._restarts,
+                'jobs_completed': self._completed,
+                'jobs_failed': self._failed
+            }
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._startup())
+        except Exception as e:
+            self._startup_error = e
+            self._loop.close()
+            return
+        finally:
+            self._ready.set()
+        health_check = self._loop.create_task(self._health_check_loop())
+        self._loop.run_forever()
+        health_check.cancel()
+        self._loop.run_until_complete(asyncio.gather(health_check, return_exceptions=True))
+        self._loop.close()
+
+    async def _startup(self):
+        self._pages = asyncio.Semaphore(self.max_pages)
+        self._launch_lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+        self._slots = [[None, 0] for _ in range(self.browsers)]
+        for slot in self._slots:
+            try:
+                slot[0] = await self._launch()
+            except Exception as e:
+                logger.error(f"Browser launch failed: {str(e)}")
+
+    async def _launch(self, reason=None):
+        with self._lock:
+            self._launches += 1
+            if reason:
+                self._restarts += 1
+        if reason:
+            logger.info(f"Render engine: relaunching browser ({reason})")
+        browser = await self._playwright.chromium.launch(**self.launch_options)
+        self._active[browser] = 0
+        return browser
+
+    async def _retire(self, browser):
+        """Close a replaced browser once its last page is done"""
+        if browser is not None and self._active.get(browser, 0) == 0:
+            self._active.pop(browser, None)
+            try:
+                await browser.close()
+            except Exception:
+                pass
+
+    async def _acquire_browser(self):
+        """Pick the next browser round-robin, relaunching it if it crashed or served enough jobs"""
+        async with self._launch_lock:
+            slot = self._slots[self._next_slot]
+            self._next_slot = (self._next_slot + 1) % len(self._slots)
+
+            browser, served = slot
+            reason = None
+            if browser is None:
+                reason = 'previous launch failed'
+            elif not browser.is_connected():
+                reason = 'browser crashed'
+            elif served >= self.max_jobs_per_browser:
+                reason = f'served {served} jobs'
+            if reason:
+                slot[0] = await self._launch(reason)
+                slot[1] = 0
+                await self._retire(browser)
+
+            slot[1] += 1
+            self._active[slot[0]] += 1
+            return slot[0]
+
+    async def _release_browser(self, browser):
+        self._active[browser] -= 1
+        if all(slot[0] is not browser for slot in self._slots):
+            await self._retire(browser)
+
+    async def _run_job(self, fn, args, kwargs, submitted):
+        self._tasks.add(asyncio.current_task())
+        waiting = True
+        try:
+            async with self._pages:
+                with self._lock:
+                    self._queued -= 1
+                    self._busy += 1
+                waiting = False
+                browser = None
+                context = None
+                try:
+                    browser = await self._acquire_browser()
+                    context = await browser.new_context(**self.context_options)
+                    if self.acquire_observer is not None:
+                        self.acquire_observer(time.monotonic() - submitted)
+                    result = await fn(context, *args, **kwargs)
+                except BaseException:
+                    with self._lock:
+                        self._failed += 1
+                    raise
+                finally:
+                    if context is not None:
+                        try:
+                            await context.close()
+                        except Exception:
+                            pass
+                    if browser is not None:
+                        await self._release_browser(browser)
+                    with self._lock:
+                        self._busy -= 1
+                with self._lock:
+                    self._completed += 1
+                return result
+        finally:
+            if waiting:
+                # Cancelled before a page was free; the job never ran
+                with self._lock:
+                    self._queued -= 1
+            self._tasks.discard(asyncio.current_task())
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            async with self._launch_lock:
+                for slot in self._slots:
+                    browser = slot[0]
+                    if browser is not None and browser.is_connected():
+                        continue
+                    try:
+                        slot[0] = await self._launch('health check failed')
+                        slot[1] = 0
+                    except Exception as e:
+                        logger.error(f"Browser relaunch failed: {str(e)}")
+                        slot[0] = None
+                        continue
+                    await self._retire(browser)
+
+    async def _close(self, wait):
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        if not wait:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for browser in list(self._active):
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self._active.clear()
+        self._slots = []
+        await self._playwright.stop()
@@ -0,0 +1,211 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from playwright.sync_api import sync_playwright
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPool:
+    """
+    Long-lived, size-bounded pool of pre-launched headless Chromium browsers.
+
+    Playwright's sync API is bound to the thread that started it, so every
+    browser lives on its own worker thread. Jobs are callables that receive a
+    fresh, isolated BrowserContext; the context is closed once the job is done.
+
+    Args:
+        size: Number of browsers (and worker threads) kept alive
+        max_jobs_per_browser: Recycle a browser after this many jobs
+        health_check_interval: Seconds between idle liveness checks
+        launch_options: Extra keyword arguments for chromium.launch()
+        context_options: Extra keyword arguments for browser.new_context()
+
+    Set `acquire_observer` to a callable(seconds) to be told how long each
+    job waited for its browser context, from submit() until it was ready.
+    """
+
+    # Jobs submitted to this pool are plain functions (see AsyncRenderEngine for coroutines)
+    asynchronous = False
+
+    def __init__(self, size=2, max_jobs_per_browser=50, health_check_interval=30,
+                 launch_options=None, context_options=None):
+        self.size = size
+        self.max_jobs_per_browser = max_jobs_per_browser
+        self.health_check_interval = health_check_interval
+        self.launch_options = {'headless': True, **(launch_options or {})}
+        self.context_options = context_options or {}
+        self.acquire_observer = None
+
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._busy = 0
+        self._launches = 0
+        self._restarts = 0
+        self._completed = 0
+        self._failed = 0
+
+    def start(self):
+        """Launch the worker threads; each one warms up its own browser"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool has been shut down")
+            if self._started:
+                return
+            self._started = True
+            for i in range(self.size):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"browser-pool-{i+1}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        logger.info(f"Browser pool started with {self.size} browsers")
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue fn(context, *args, **kwargs) on the next free browser and return a Future
+
+        Raises RuntimeError once the pool has been shut down, rather than launching new browsers.
+        """
+        self.start()
+        future = Future()
+        self._jobs.put((future, fn, args, kwargs, time.monotonic()))
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Borrow a browser, run fn(context, ...) on it and wait for the result"""
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    def shutdown(self, wait=True):
+        """Close every browser once the already queued jobs are finished; the pool cannot be started again"""
+        with self._lock:
+            self._closed = True
+            if not self._started:
+                return
+            self._started = False
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._jobs.put(None)
+        if wait:
+            for worker in workers:
+                worker.join()
+        logger.info("Browser pool shut down")
+
+    def stats(self):
+        """Snapshot of pool occupancy and lifetime counters"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'busy': self._busy,
+                'idle': max(0, len(self._workers) - self._busy),
+                'queued': self._jobs.qsize(),
+                'browsers_launched': self._launches,
+                'browser_restarts': self._restarts,
+                'jobs_completed': self._completed,
+                'jobs_failed': self._failed
+            }
+
+    def _launch(self, playwright, browser, reason=None):
+        """Close the given browser (if any) and launch a replacement"""
+        if browser is not None:
+            try:
+                browser.close()
+            except Exception:
+                pass
+        with self._lock:
+            self._launches += 1
+            if reason:
+                self._restarts += 1
+        if reason:
+            logger.info(f"{threading.current_thread().name}: relaunching browser ({reason})")
+        return playwright.chromium.launch(**self.launch_options)
+
+    def _worker_loop(self):
+        playwright = sync_playwright().start()
+        browser = None
+        jobs_served = 0
+
+        try:
+            try:
+                browser = self._launch(playwright, None)
+            except Exception as e:
+                logger.error(f"{threading.current_thread().name}: browser launch failed: {str(e)}")
+
+            while True:
+                try:
+                    item = self._jobs.get(timeout=self.health_check_interval)
+                except queue.Empty:
+                    # Idle health check: replace crashed browsers before the next job arrives
+                    if browser is not None and not browser.is_connected():
+                        try:
+                            browser = self._launch(playwright, browser, reason='health check failed')
+                            jobs_served = 0
+                        except Exception as e:
+                            logger.error(f"Browser relaunch failed: {str(e)}")
+                            browser = None
+                    continue
+
+                if item is None:
+                    break
+
+                future, fn, args, kwargs, submitted = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    if browser is None:
+                        browser = self._launch(playwright, None, reason='previous launch failed')
+                        jobs_served = 0
+                    elif not browser.is_connected():
+                        browser = self._launch(playwright, browser, reason='browser crashed')
+                        jobs_served = 0
+                    elif jobs_served >= self.max_jobs_per_browser:
+                        browser = self._launch(playwright, browser, reason=f'served {jobs_served} jobs')
+                        jobs_served = 0
+                except Exception as e:
+                    browser = None
+                    with self._lock:
+                        self._failed += 1
+                    future.set_exception(e)
+                    continue
+
+                with self._lock:
+                    self._busy += 1
+                context = None
+                try:
+                    context = browser.new_context(**self.context_options)
+                    if self.acquire_observer is not None:
+                        self.acquire_observer(time.monotonic() - submitted)
+                    result = fn(context, *args, **kwargs)
+                except BaseException as e:
+                    with self._lock:
+                        self._failed += 1
+                    future.set_exception(e)
+                else:
+                    with self._lock:
+                        self._completed += 1
+                    future.set_result(result)
+                finally:
+                    if context is not None:
+                        try:
+                            context.close()
+                        except Exception:
+                            pass
+                    jobs_served += 1
+                    with self._lock:
+                        self._busy -= 1
+        finally:
+            if browser is not None:
+                try:
+                    browser.close()
+                except Exception:
+                    pass
+            playwright.stop()
@@ -0,0 +1,91 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class OperationCancelled(Exception):
+    """Raised inside a conversion once its CancelToken is cancelled or a deadline has passed"""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation shared by every thread working on one conversion
+
+    The request thread calls cancel() (e.g. when the client timed out) and
+    the workers call check() between units of work: parse events, sections,
+    screenshots and sheets. check() also raises once the overall deadline
+    or the deadline of the current stage has passed.
+
+    Args:
+        timeout: Overall seconds allowed for the conversion, or None
+    """
+
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.stage_name = None
+        self.stage_deadline = None
+        self.reason = None
+        self._cancelled = threading.Event()
+        self._parent = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self, reason="cancelled"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def child(self):
+        """
+        Token for work running alongside the current stage, e.g. parsing the next report of a batch
+
+        It runs its own stages, shares this token's overall deadline and is
+        cancelled along with this token.
+        """
+        child = CancelToken()
+        child.deadline = self.deadline
+        child._parent = self
+        return child
+
+    def check(self):
+        """Raise OperationCancelled if the conversion should stop"""
+        if self._parent is not None and self._parent.cancelled:
+            self.cancel(self._parent.reason)
+        if self._cancelled.is_set():
+            raise OperationCancelled(self.reason)
+        now = time.monotonic()
+        if self.stage_deadline is not None and now > self.stage_deadline:
+            self.cancel(f"{self.stage_name} stage exceeded its deadline")
+            raise OperationCancelled(self.reason)
+        if self.deadline is not None and now > self.deadline:
+            self.cancel("deadline exceeded")
+            raise OperationCancelled(self.reason)
+
+    def remaining(self):
+        """Seconds until the nearest deadline, or None without one"""
+        deadlines = [d for d in (self.deadline, self.stage_deadline) if d is not None]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    @contextmanager
+    def stage(self, name, timeout=None):
+        """Run a block as a named stage with its own deadline"""
+        self.check()
+        self.stage_name = name
+        self.stage_deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            yield self
+            # Catches stages that overran inside work that could not be interrupted
+            self.check()
+        finally:
+            self.stage_name = None
+            self.stage_deadline = None
+
+
+def check_cancelled(cancel):
+    """CancelToken.check() for code paths where the token is optional"""
+    if cancel is not None:
+        cancel.check()
@@ -0,0 +1,298 @@
+import logging
+import time
+
+import pandas as pd
+
+from cancellation import OperationCancelled, check_cancelled
+from html_analysis import HtmlDocument, as_html_document
+from services import SECTION_HEADING_TAG, SECTION_MARKER_TEXT, extract_marked_sections
+from streaming_extraction import iter_marked_sections, iter_table_rows, open_html_source
+
+logger = logging.getLogger(__name__)
+
+def extract_outputs(html_source, outputs, streaming=False, cancel=None, encoding=None, timings=None):
+    """
+    Run the requested extractors and return (sections, data_sheets)
+    
+    Inputs and results are plain strings, bytes, lists and tuples, so this
+    can run in a worker process of a ProcessPoolExecutor.
+    
+    Args:
+        html_source: Markup (str or bytes) or the os.PathLike path of an HTML file
+        outputs: Requested output sheets; sections is None without 'images'
+        streaming: Use the incremental parser instead of a full parse tree
+        cancel: Optional CancelToken (only usable in the calling process)
+        encoding: Encoding of byte input, e.g. from uploads.sniff_encoding()
+        timings: Optional dict that receives the seconds spent in each step:
+            'parse', 'extract' (tables, text, meta) and 'section_extraction';
+            the streaming parser has no separate 'parse' step
+    """
+    if timings is None:
+        timings = {}
+    if streaming:
+        return _extract_streaming(html_source, outputs, cancel, encoding, timings)
+    return _extract_parsed(html_source, outputs, encoding, timings)
+
+def _extract_parsed(html_source, outputs, encoding=None, timings=None):
+    """Run the requested extractors over one shared parse tree"""
+    started = time.perf_counter()
+    stream, close_stream = open_html_source(html_source)
+    try:
+        html_content = stream.read()
+    finally:
+        if close_stream:
+            stream.close()
+
+    # Parse once; every extractor below reads the same tree
+    document = HtmlDocument(html_content, encoding=encoding)
+    data_sheets = []
+    timings['parse'] = time.perf_counter() - started
+    started = time.perf_counter()
+
+    if 'tables' in outputs:
+        # Extract tables with memory efficiency
+        tables = extract_tables_from_html(document)
+        logger.info(f"Extracted {len(tables)} tables")
+        data_sheets.extend(_table_sheets(tables))
+    
+    if 'text' in outputs:
+        # Extract text content
+        text_content = extract_text_content(document)
+        logger.info(f"Extracted {len(text_content)} text elements")
+        data_sheets.append(('Text Content', ['Element', 'Content'], text_content))
+    
+    if 'meta' in outputs:
+        # Extract meta information
+        meta_info = extract_meta_information(document)
+        logger.info(f"Extracted {len(meta_info)} meta tags")
+        data_sheets.append(('Meta Information', ['Meta', 'Content'], meta_info))
+    
+    timings['extract'] = time.perf_counter() - started
+    
+    sections = None
+    if 'images' in outputs:
+        # Collect the 'Uncovered Link' sections in memory
+        started = time.perf_counter()
+        sections = extract_marked_sections(document)
+        timings['section_extraction'] = time.perf_counter() - started
+    document.decompose()
+
+    return sections, data_sheets
+
+def _extract_streaming(html_source, outputs, cancel=None, encoding=None, timings=None):
+    """Run the requested extractors with the incremental parser, keeping memory bounded"""
+    logger.info("Using streaming extraction")
+    data_sheets = []
+
+    if 'tables' in outputs:
+        started = time.perf_counter()
+        tables = extract_tables_streaming(html_source, cancel, encoding)
+        logger.info(f"Extracted {len(tables)} tables")
+        data_sheets.extend(_table_sheets(tables))
+        timings['extract'] = time.perf_counter() - started
+
+    sections = None
+    if 'images' in outputs:
+        started = time.perf_counter()
+        sections = []
+        for section in iter_marked_sections(html_source, SECTION_HEADING_TAG, SECTION_MARKER_TEXT,
+                                            encoding=encoding):
+            check_cancelled(cancel)
+            sections.append(section)
+        timings['section_extraction'] = time.perf_counter() - started
+
+    return sections, data_sheets
+
+def _table_sheets(tables):
+    """(title, header, rows) sheet tuples for the extracted table DataFrames"""
+    for table in tables:
+        df = table['data']
+        header = None if isinstance(df.columns, pd.RangeIndex) else [str(c) for c in df.columns]
+        yield (table['title'], header, list(df.itertuples(index=False, name=None)))
+
+def extract_tables_from_html(html_content):
+    """Extract tables from HTML content (markup or HtmlDocument) with memory optimization"""
+    try:
+        document = as_html_document(html_content)
+        tables = document.find_all('table')
+        
+        dataframes = []
+        
+        for i, table in enumerate(tables):
+            try:
+                # Extract table data efficiently
+                rows = []
+                headers = []
+                
+                # Find headers
+                header_row = table.find('thead')
+                if header_row:
+                    header_cells = header_row.find_all(['th', 'td'])
+                    headers = [cell.get_text(strip=True) for cell in header_cells]
+                else:
+                    first_row = table.find('tr')
+                    if first_row:
+                        first_row_cells = first_row.find_all(['th', 'td'])
+                        if any(cell.name == 'th' for cell in first_row_cells):
+                            headers = [cell.get_text(strip=True) for cell in first_row_cells]
+                
+                # Extract all rows efficiently
+                for row in table.find_all('tr'):
+                    cells = row.find_all(['td', 'th'])
+                    if cells:
+                        row_data = [cell.get_text(strip=True) for cell in cells]
+                        rows.append(row_data)
+                
+                if rows:
+                    dataframes.append(_table_dataframe(i, headers, rows))
+                    
+            except Exception as e:
+                logger.warning(f"Error processing table {i}: {str(e)}")
+                continue
+        
+        return dataframes
+        
+    except Exception as e:
+        logger.error(f"Error in table extraction: {str(e)}")
+        return []
+
+def extract_tables_streaming(html_source, cancel=None, encoding=None):
+    """Extract tables from markup, bytes or a file with bounded memory (no full parse tree)"""
+    try:
+        tables = {}
+        
+        for item in iter_table_rows(html_source, encoding=encoding):
+            check_cancelled(cancel)
+            for index in item['tables']:
+                table = tables.setdefault(index, {'thead_headers': None, 'rows': []})
+                if 'thead' in item:
+                    table['thead_headers'] = item['thead']
+                else:
+                    table['rows'].append(item)
+        
+        dataframes = []
+        for i, table in sorted(tables.items()):
+            try:
+                # Same headers and rows as extract_tables_from_html: the first thead, else a first row with th cells
+                table_rows = sorted(table['rows'], key=lambda row: row['order'])
+                headers = table['thead_headers']
+                if headers is None:
+                    headers = table_rows[0]['cells'] if table_rows and table_rows[0]['th'] else []
+                rows = [list(row['cells']) for row in table_rows if row['cells']]
+                if rows:
+                    dataframes.append(_table_dataframe(i, headers, rows))
+            except Exception as e:
+                logger.warning(f"Error processing table {i}: {str(e)}")
+                continue
+        
+        return dataframes
+        
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Error in streaming table extraction: {str(e)}")
+        return []
+
+def _table_dataframe(index, headers, rows):
+    """Build the DataFrame entry for one table from its header and row cell texts"""
+    # Skip header row if it matches
+    if headers and len(rows) > 0 and len(headers) == len(rows[0]):
+        if headers == rows[0]:
+            rows = rows[1:]
+    
+    # Create DataFrame with error handling
+    if headers and len(headers) > 0:
+        max_cols = len(headers)
+        for j, row in enumerate(rows):
+            while len(row) < max_cols:
+                row.append('')
+            rows[j] = row[:max_cols]
+        
+        df = pd.DataFrame(rows, columns=headers)
+    else:
+        df = pd.DataFrame(rows)
+    
+    return {
+        'data': df,
+        'title': f'Table_{index+1}',
+        'index': index
+    }
+
+def extract_text_content(html_content):
+    """Extract text content (markup or HtmlDocument) with memory optimization"""
+    try:
+        # get_text() already skips script and style contents, so the shared tree is left intact
+        document = as_html_document(html_content)
+        
+        content_data = []
+        
+        # Extract title
+        title = document.find('title')
+        if title:
+            content_data.append(['Title', title.get_text(strip=True)])
+        
+        # Extract headings
+        headings = document.find_all('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+        for heading in headings:
+            level = heading.name.upper()
+            text = heading.get_text(strip=True)
+            if text:
+                content_data.append([f'{level}', text])
+        
+        # Extract paragraphs (limit to prevent memory issues)
+        paragraphs = document.find_all('p')[:100]  # Limit to first 100 paragraphs
+        for i, p in enumerate(paragraphs):
+            text = p.get_text(strip=True)
+            if text:
+                content_data.append([f'Paragraph_{i+1}', text[:500]])  # Limit text length
+        
+        # Extract lists (limit to prevent memory issues)
+        lists = document.find_all('ul', 'ol')[:20]  # Limit to first 20 lists
+        for i, lst in enumerate(lists):
+            list_type = 'Ordered List' if lst.name == 'ol' else 'Unordered List'
+            items = lst.find_all('li')[:20]  # Limit items per list
+            for j, item in enumerate(items):
+                text = item.get_text(strip=True)
+                if text:
+                    content_data.append([f'{list_type}_{i+1}_Item_{j+1}', text[:200]])
+        
+        # Extract links (limit to prevent memory issues)
+        links = [a for a in document.find_all('a') if a.get('href')][:50]  # Limit to first 50 links
+        for i, link in enumerate(links):
+            text = link.get_text(strip=True)
+            href = link['href']
+            if text and href:
+                content_data.append([f'Link_{i+1}_Text', text[:100]])
+                content_data.append([f'Link_{i+1}_URL', href[:200]])
+        
+        return content_data
+        
+    except Exception as e:
+        logger.error(f"Error in text extraction: {str(e)}")
+        return []
+
+def extract_meta_information(html_content):
+    """Extract meta information (markup or HtmlDocument) with error handling"""
+    try:
+        document = as_html_document(html_content)
+        
+        meta_data = []
+        
+        # Extract meta tags
+        meta_tags = document.find_all('meta')
+        for meta in meta_tags:
+            try:
+                if meta.get('name'):
+                    content = meta.get('content', '')[:500]  # Limit content length
+                    meta_data.append([f'Meta_{meta["name"]}', content])
+                elif meta.get('property'):
+                    content = meta.get('content', '')[:500]
+                    meta_data.append([f'Property_{meta["property"]}', content])
+            except Exception:
+                continue
+        
+        return meta_data
+        
+    except Exception as e:
+        logger.error(f"Error in meta extraction: {str(e)}")
+        return []
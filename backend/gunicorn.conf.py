@@ -0,0 +1,49 @@
+"""
+Gunicorn settings for running the backend in production
+
+    cd backend
+    gunicorn -c gunicorn.conf.py
+
+Every worker process builds the app through create_app() after the fork and
+owns its own browsers, thread pools and caches; preloading the app in the
+master would fork browser threads, so it stays off. Job state is written to
+a directory shared by all workers, so any worker can answer /jobs/<id>, and
+so are their metrics, so /metrics reports the totals of all workers.
+"""
+import multiprocessing
+import os
+import tempfile
+
+wsgi_app = 'html2image2excel_backend:create_app()'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Each worker runs its own browsers, so a few processes with many threads beat many small processes
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count() // 2)))
+worker_class = 'gthread'
+threads = 16  # Request threads per worker; they mostly wait for admission and rendering
+preload_app = False
+
+timeout = 930  # BATCH_TIMEOUT, the longest request deadline, plus time to upload and download
+graceful_timeout = 60  # Let running conversions finish on reload or shutdown
+max_requests = 1000  # Recycle workers now and then to return fragmented memory to the OS
+max_requests_jitter = 100
+
+
+def on_starting(server):
+    # Inherited by every worker: process count for capacity planning, the worker timeout request deadlines must
+    # fit in, shared directories for job state, metrics and request profiles
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
+    os.environ['HTML2EXCEL_WORKER_TIMEOUT'] = str(server.cfg.timeout)
+    os.environ.setdefault('HTML2EXCEL_JOB_DIR', tempfile.mkdtemp(prefix='html2excel-jobs-'))
+    os.environ.setdefault('HTML2EXCEL_METRICS_DIR', tempfile.mkdtemp(prefix='html2excel-metrics-'))
+    os.environ.setdefault('HTML2EXCEL_PROFILE_DIR', tempfile.mkdtemp(prefix='html2excel-profiles-'))
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {worker.pid} ready with its own browsers")
+
+
+def worker_exit(server, worker):
+    # Close this worker's browsers and pools on graceful shutdown, reload or max_requests recycling
+    from html2image2excel_backend import stop_services
+    stop_services()
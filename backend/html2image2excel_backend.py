@@ -1,21 +1,34 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, make_response
 from flask_cors import CORS
-from bs4 import BeautifulSoup
 # import pandas as pd
+import atexit
+import hashlib
+import hmac
 import io
+import multiprocessing
 import os
 import tempfile
 import threading
 import time
-import uuid
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from functools import wraps
 import gc
 import logging
-import pandas as pd
 from werkzeug.serving import WSGIRequestHandler
 
-from services import convert_html_to_excel, extract_html_content
+from admission import AdmissionController, AdmissionTimeout, QueueFull, derive_capacity
+from async_render_engine import AsyncRenderEngine
+from browser_pool import BrowserPool
+from cancellation import CancelToken, OperationCancelled
+from extraction import extract_outputs
+from jobs import JobStore
+from metrics import Registry, timed_call
+from profiling import NO_PROFILE, ProfileStore
+from result_cache import ResultCache
+from services import (BATCH_LAYOUTS, DEFAULT_OUTPUTS, SECTION_HEADING_TAG, SECTION_MARKER_TEXT, STREAMING_OUTPUTS,
+                      STREAMING_THRESHOLD, build_batch_workbook, build_workbook, capture_sections_images,
+                      parse_outputs)
+from uploads import SpooledUpload, UploadTooLarge, read_html_archive
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,378 +39,1003 @@ CORS(app)
 
 # Configuration for concurrent users
 MAX_WORKERS = 15  # Can handle more than 10 concurrent requests
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+SERVER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', '1'))  # Server worker processes on this machine (gunicorn.conf.py)
+CPU_WORKERS = ((os.cpu_count() or 1) - 1) // SERVER_PROCESSES  # Processes for parsing and workbook building; 0 (no spare core) keeps them in-thread
+CPU_OFFLOAD_THRESHOLD = 256 * 1024  # Smaller uploads stay in-thread, where pickling would cost more than it saves
+MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+UPLOAD_SPOOL_BYTES = 1024 * 1024  # Uploads up to this size are kept in memory, larger ones in a temp file until processed
 REQUEST_TIMEOUT = 300  # 5 minutes timeout
-MAX_CONCURRENT_REQUESTS = 12
+MAX_BATCH_FILES = 100  # Reports accepted by one /batch request
+MAX_BATCH_SIZE = 200 * 1024 * 1024  # Total (extracted) size of the reports in one /batch request
+BATCH_TIMEOUT = 900  # Seconds a /batch request may take
+WORKER_TIMEOUT = int(os.environ.get('HTML2EXCEL_WORKER_TIMEOUT', '0'))  # gunicorn's worker timeout (gunicorn.conf.py); 0 without gunicorn
+TRANSFER_MARGIN = 30  # Seconds of the worker timeout left for uploading and downloading
+if WORKER_TIMEOUT:
+    # A request gives up before gunicorn would kill its worker halfway through it
+    REQUEST_TIMEOUT = max(1, min(REQUEST_TIMEOUT, WORKER_TIMEOUT - TRANSFER_MARGIN))
+    BATCH_TIMEOUT = max(1, min(BATCH_TIMEOUT, WORKER_TIMEOUT - TRANSFER_MARGIN))
+BATCH_FILENAME = 'batch'  # Batch workbooks download as batch_processed.xlsx
+WORKBOOK_SPOOL_BYTES = 8 * 1024 * 1024  # Generated workbooks up to this size stay in memory, larger ones go to a temp file
+STAGE_TIMEOUTS = {  # Seconds each stage of a conversion may take before it is cancelled
+    'parsing': 60,
+    'rendering': 240,
+    'building': 60
+}
+ADMISSION_QUEUE_SIZE = 50  # Requests that may wait for a processing slot before new ones get 503
+ADMISSION_WAIT_TIMEOUT = 60  # Seconds a /process request waits for a slot before giving up
+REQUESTS_PER_RENDER_SLOT = 2  # Requests admitted per browser; the rest of a request is parsing and saving
+MEMORY_PER_REQUEST = 512 * 1024 * 1024  # Estimated peak memory of one request, caps the admitted count
+RENDER_ENGINE = 'async'  # 'async' multiplexes pages over a few browsers on one event loop, 'threads' runs a browser per thread
+BROWSER_POOL_SIZE = 4  # Warm headless browsers shared by all requests ('threads' engine)
+BROWSER_MAX_JOBS = 50  # Recycle a browser after this many conversions ('threads' engine)
+ASYNC_BROWSERS = 2  # Browser processes the 'async' engine spreads its pages over
+ASYNC_MAX_PAGES = 16  # Pages the 'async' engine renders at once
+ASYNC_MAX_JOBS_PER_BROWSER = 200  # Retire an 'async' engine browser after this many pages
+RENDER_SLOTS = ASYNC_MAX_PAGES if RENDER_ENGINE == 'async' else BROWSER_POOL_SIZE
+RENDER_SHARDS = 4  # Pages a single report's boxes may be spread across
+CAPTURE_MODE = 'batch'  # 'batch' crops all boxes from a few full-page screenshots, 'element' shoots each box
+MAX_PENDING_JOBS = 50  # Queued or running jobs accepted through /jobs
+JOB_RESULT_TTL = 600  # Seconds a finished job's workbook stays downloadable
+JOB_STORE_DIR = os.environ.get('HTML2EXCEL_JOB_DIR')  # Job state shared by all server processes (gunicorn.conf.py)
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024  # In-memory budget for cached workbooks
+RESULT_CACHE_DIR = None  # Directory for the on-disk cache tier; None keeps the cache in memory only
+RESULT_CACHE_DISK_MAX_BYTES = 2 * 1024 * 1024 * 1024
+SECTION_CACHE_MAX_BYTES = 128 * 1024 * 1024  # In-memory budget for per-section screenshots
+SECTION_CACHE_DIR = None  # Directory for the on-disk screenshot tier; None keeps it in memory only
+RENDER_ALLOWED_HOSTS = ()  # Hosts uploaded reports may load resources from; all others are blocked
+METRICS_DIR = os.environ.get('HTML2EXCEL_METRICS_DIR')  # Metrics shared by all server processes (gunicorn.conf.py)
+METRICS_FLUSH_INTERVAL = 5  # Seconds between writes of this process's metrics to METRICS_DIR
+ADMIN_TOKEN = os.environ.get('HTML2EXCEL_ADMIN_TOKEN')  # X-Admin-Token value that unlocks profiling; unset disables it
+PROFILE_DIR = os.environ.get('HTML2EXCEL_PROFILE_DIR')  # Profiles shared by all server processes (gunicorn.conf.py)
+MAX_PROFILES = 20  # Profiles kept on disk; older ones are deleted
+BOX_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)  # Seconds; one box screenshot
 
 # Thread pool for processing requests
 executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
-# Request tracking
-active_requests = {}
-request_lock = threading.Lock()
+# Worker processes for the CPU-bound stages, so one large report does not hold the GIL for every request.
+# 'spawn' keeps the children free of the parent's browser threads.
+cpu_pool = ProcessPoolExecutor(
+    max_workers=CPU_WORKERS,
+    mp_context=multiprocessing.get_context('spawn')
+) if CPU_WORKERS else None
 
-class RequestTracker:
-    def __init__(self):
-        self.count = 0
-        self.lock = threading.Lock()
-    
-    def can_accept_request(self):
-        with self.lock:
-            return self.count < MAX_CONCURRENT_REQUESTS
-    
-    def add_request(self):
-        with self.lock:
-            self.count += 1
-            logger.info(f"Active requests: {self.count}")
-    
-    def remove_request(self):
-        with self.lock:
-            self.count = max(0, self.count - 1)
-            logger.info(f"Active requests: {self.count}")
+# Pre-launched browsers borrowed by process_html_content; both engines share the submit()/stats() interface
+if RENDER_ENGINE == 'async':
+    browser_pool = AsyncRenderEngine(
+        browsers=ASYNC_BROWSERS,
+        max_pages=ASYNC_MAX_PAGES,
+        max_jobs_per_browser=ASYNC_MAX_JOBS_PER_BROWSER
+    )
+else:
+    browser_pool = BrowserPool(size=BROWSER_POOL_SIZE, max_jobs_per_browser=BROWSER_MAX_JOBS)
+
+# One slot per page the engine can render at once; every rendered shard of every job holds one while it renders
+render_slots = threading.BoundedSemaphore(RENDER_SLOTS)
+
+# Jobs submitted through /jobs and their results
+job_store = JobStore(ttl=JOB_RESULT_TTL, max_finished=MAX_PENDING_JOBS, shared_dir=JOB_STORE_DIR)
+
+# Workbooks of previous uploads, keyed by content hash and processing options
+result_cache = ResultCache(
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    disk_dir=RESULT_CACHE_DIR,
+    disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES
+)
+
+# Screenshots of individual sections, so reports that share most sections only render the changed ones
+section_image_cache = ResultCache(
+    max_bytes=SECTION_CACHE_MAX_BYTES,
+    disk_dir=SECTION_CACHE_DIR,
+    suffix='.png'
+)
+
+# Requests and jobs run at most `capacity` at a time; bursts wait in a bounded queue, smallest uploads first
+admission = AdmissionController(
+    capacity=derive_capacity(
+        RENDER_SLOTS,
+        requests_per_slot=REQUESTS_PER_RENDER_SLOT,
+        memory_per_request=MEMORY_PER_REQUEST,
+        max_workers=MAX_WORKERS,
+        processes=SERVER_PROCESSES
+    ),
+    max_queue=ADMISSION_QUEUE_SIZE
+)
+
+# Span trees, CPU profiles and browser traces of requests an admin asked to profile
+profile_store = ProfileStore(directory=PROFILE_DIR, max_profiles=MAX_PROFILES) if ADMIN_TOKEN else None
+
+def cache_counts(stat):
+    """{cache name: stats()[stat]} of the result and section caches, read at scrape time"""
+    caches = {'result': result_cache, 'section': section_image_cache}
+    return {name: cache.stats()[stat] for name, cache in caches.items() if cache is not None}
+
+def admission_state():
+    stats = admission.stats()
+    return {'running': stats['running'], 'queued': stats['queued']}
 
-request_tracker = RequestTracker()
+def render_page_state():
+    stats = browser_pool.stats()
+    return {'busy': stats['busy'], 'idle': stats['idle'], 'queued': stats['queued']}
 
-def rate_limit(f):
+# Prometheus metrics served on /metrics; with METRICS_DIR every server process contributes to the totals
+metrics = Registry(shared_dir=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL)
+stage_seconds = metrics.histogram(
+    'html2excel_stage_seconds',
+    'Seconds spent in each stage of a conversion',
+    ['stage']
+)
+box_seconds = metrics.histogram(
+    'html2excel_box_screenshot_seconds',
+    'Seconds spent capturing one box in the browser',
+    buckets=BOX_SECONDS_BUCKETS
+)
+requests_total = metrics.counter(
+    'html2excel_requests_total',
+    'Requests answered, by endpoint and status',
+    ['endpoint', 'status']
+)
+boxes_rendered = metrics.counter('html2excel_boxes_rendered_total', 'Boxes screenshotted in a browser')
+upload_bytes = metrics.counter('html2excel_upload_bytes_total', 'Bytes of HTML uploaded')
+workbook_bytes = metrics.counter('html2excel_workbook_bytes_total', 'Bytes of workbooks sent')
+timeouts = metrics.counter('html2excel_timeouts_total', 'Conversions stopped by a deadline', ['endpoint'])
+busy_responses = metrics.counter('html2excel_busy_responses_total', '503 responses, by error code', ['code'])
+metrics.counter('html2excel_cache_hits_total', 'Cache lookups that found an entry', ['cache'],
+                callback=lambda: cache_counts('hits'))
+metrics.counter('html2excel_cache_misses_total', 'Cache lookups that found nothing', ['cache'],
+                callback=lambda: cache_counts('misses'))
+metrics.counter(
+    'html2excel_browser_restarts_total',
+    'Browsers relaunched after a crash, failed health check or job limit',
+    callback=lambda: browser_pool.stats()['browser_restarts']
+)
+metrics.gauge('html2excel_admission_requests', 'Requests by admission state', ['state'], callback=admission_state)
+metrics.gauge('html2excel_render_pages', 'Render pages (or browsers) by state', ['state'], callback=render_page_state)
+
+# Time from submitting a render job until its browser context is ready
+browser_pool.acquire_observer = lambda seconds: stage_seconds.observe(seconds, stage='browser_acquire')
+
+def observe_stages(timings):
+    """Record the step timings a conversion function filled in"""
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+
+def observe_box(seconds):
+    box_seconds.observe(seconds)
+    boxes_rendered.inc()
+
+def busy_response(message, code='SERVER_BUSY', **details):
+    """503 telling the client how long to back off, based on the current queue"""
+    busy_responses.inc(code=code)
+    stats = admission.stats()
+    retry_after = max(1, stats['queued'] // max(1, stats['capacity']) + 1)
+    response = jsonify({
+        'error': message,
+        'code': code,
+        'queue_length': stats['queued'],
+        'retry_after_seconds': retry_after,
+        **details
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def admission_control(f):
+    """Hold the request in the admission queue until a processing slot is free"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not request_tracker.can_accept_request():
-            return jsonify({
-                'error': 'Server is busy. Please try again in a moment.',
-                'code': 'SERVER_BUSY'
-            }), 503
+        try:
+            ticket = admission.enter(request.content_length or 0)
+        except QueueFull:
+            return busy_response('Server is busy. Please try again in a moment.')
         
-        request_tracker.add_request()
-        request_id = str(uuid.uuid4())
+        try:
+            ticket.wait(ADMISSION_WAIT_TIMEOUT)
+        except AdmissionTimeout as e:
+            return busy_response(
+                f'No processing slot became free within {ADMISSION_WAIT_TIMEOUT}s. Please try again in a moment.',
+                code='QUEUE_TIMEOUT',
+                queue_position=e.position
+            )
         
         try:
-            with request_lock:
-                active_requests[request_id] = time.time()
-            
-            result = f(*args, **kwargs)
-            return result
+            logger.info(f"Admitted request after {ticket.waited:.2f}s (queue position {ticket.initial_position})")
+            stage_seconds.observe(ticket.waited, stage='queue_wait')
+            response = make_response(f(*args, **kwargs))
+            response.headers['X-Queue-Position'] = str(ticket.initial_position)
+            response.headers['X-Queue-Wait'] = f"{ticket.waited:.3f}"
+            return response
         finally:
-            request_tracker.remove_request()
-            with request_lock:
-                active_requests.pop(request_id, None)
+            ticket.release()
             # Force garbage collection after each request
             gc.collect()
     
     return decorated_function
 
-def process_html_content(html_content, filename):
-    """Process HTML content in a separate thread"""
-    try:
-        logger.info(f"Processing file: {filename}")
-        
-        # Extract tables with memory efficiency
-        tables = extract_tables_from_html(html_content)
-        logger.info(f"Extracted {len(tables)} tables")
-        
-        # Extract text content
-        text_content = extract_text_content(html_content)
-        logger.info(f"Extracted {len(text_content)} text elements")
-        
-        # Extract meta information
-        meta_info = extract_meta_information(html_content)
-        logger.info(f"Extracted {len(meta_info)} meta tags")
-        
-        # Create a temporary HTML file
-        current_directory = os.getcwd()
-        extractedhtml_file_path = os.path.join(current_directory, 'temporaryHTML.html')
-        print(extractedhtml_file_path)
-        # Write the extracted HTML file 
-        extract_html_content(extractedhtml_file_path, html_content)
+def is_admin():
+    """True when the current request carries the admin token in its X-Admin-Token header"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+def admin_required(f):
+    """Reject requests without the admin token"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'error': 'This endpoint requires the admin token', 'code': 'ADMIN_REQUIRED'}), 403
+        return f(*args, **kwargs)
+    
+    return decorated_function
 
-        # Convert HTML to Excel
-        excel_output = os.path.join(current_directory,"html2image2excel_output.xlsx")
-        convert_html_to_excel(extractedhtml_file_path, excel_output_path=excel_output, class_selector=".image-box")
+def read_profile_flag():
+    """
+    Whether the current request asks to be profiled (X-Profile: 1 header or profile=1)
+    
+    Returns:
+        (profiling, None), or (False, error_response) when a non-admin asks
+    """
+    flag = (request.headers.get('X-Profile') or request.args.get('profile') or '').strip().lower()
+    if flag not in ('1', 'true', 'yes'):
+        return False, None
+    if not is_admin():
+        return False, (jsonify({'error': 'Profiling requires the admin token', 'code': 'ADMIN_REQUIRED'}), 403)
+    return True, None
 
-        # Read the Excel file into memory
-        with open(excel_output, "rb") as f:
-            file_data = f.read()
+def profiling_gate(f):
+    """Refuse profiling requests from non-admins before they take a place in the admission queue"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        _, error = read_profile_flag()
+        if error:
+            return error
+        return f(*args, **kwargs)
+    
+    return decorated_function
 
-        # Load workbook from memory
-        excel_output = io.BytesIO(file_data)
+def with_profile_id(response, profile):
+    """Point the client of a profiled request at its profile"""
+    response = make_response(response)
+    if profile.enabled:
+        response.headers['X-Profile-Id'] = profile.id
+        response.headers['X-Profile-Url'] = f'/profiles/{profile.id}'
+    return response
 
-        # Save Excel to memory
-        excel_output.seek(0)
+def process_html_content(html_upload, filename, outputs=DEFAULT_OUTPUTS, progress=None, cancel=None, profile=None):
+    """
+    Process HTML content in a separate thread, computing only the requested outputs
+    
+    Args:
+        html_upload: SpooledUpload holding the raw bytes; the parsers decode
+            them with its sniffed encoding, the caller closes it
+        progress: Optional callable(stage, done=None, total=None) told about
+            each stage and about every rendered box
+        cancel: Optional CancelToken; each stage runs under its STAGE_TIMEOUTS
+            deadline and the conversion stops with OperationCancelled once
+            the token is cancelled, freeing its browser pages
+        profile: Optional RequestProfile; records a span per stage, a CPU
+            profile of this thread and Playwright traces, and is finished
+            (written to disk) when the conversion ends. Profiled conversions
+            keep parsing and building in this thread, where cProfile sees them
+    
+    Returns:
+        Binary file object holding the workbook, positioned at the start;
+        the caller closes it (send_workbook does so once the response is sent)
+    """
+    if progress is None:
+        progress = lambda stage, done=None, total=None: None
+    if cancel is None:
+        cancel = CancelToken()
+    if profile is None:
+        profile = NO_PROFILE
+    try:
+        with profile.cpu_profile():
+            logger.info(f"Processing file: {filename} (outputs: {', '.join(outputs)})")
+            progress('parsing')
+            
+            # Parsing and workbook building run in the process pool; rendering stays on the browser threads
+            with cancel.stage('parsing', STAGE_TIMEOUTS['parsing']), profile.span('parsing', bytes=html_upload.size):
+                sections, data_sheets = parse_upload(html_upload, outputs, cancel, profile)
+            
+            images = None
+            if sections is not None:
+                progress('rendering', 0, len(sections))
+                # Render the sections across pooled pages; browsers are released before the workbook is built
+                with cancel.stage('rendering', STAGE_TIMEOUTS['rendering']), \
+                        profile.span('rendering', sections=len(sections)) as attributes:
+                    images = render_sections(sections, cancel,
+                                             progress=lambda done, total: progress('rendering', done, total),
+                                             profile=profile)
+                    attributes['boxes'] = len(images)
 
-        return excel_output
+            progress('building')
+            with cancel.stage('building', STAGE_TIMEOUTS['building']), profile.span('building'):
+                offload = cpu_pool is not None and html_upload.size >= CPU_OFFLOAD_THRESHOLD and not profile.enabled
+                output = save_workbook(cancel, offload, build_workbook, images, data_sheets, profile=profile)
+        profile.finish()
+        return output
         
+    except OperationCancelled as e:
+        logger.warning(f"Cancelled processing of {filename}: {str(e)}")
+        profile.finish('cancelled', str(e))
+        raise
     except Exception as e:
         logger.error(f"Error processing {filename}: {str(e)}")
+        profile.finish('failed', str(e))
         raise e
 
-def extract_tables_from_html(html_content):
-    """Extract tables from HTML content with memory optimization"""
+def process_html_batch(html_uploads, outputs=DEFAULT_OUTPUTS, layout='sheets', cancel=None):
+    """
+    Convert several reports into one workbook
+    
+    The reports share the render engine and are rendered one after another,
+    while a helper thread parses the next report (in the process pool for
+    large uploads), so parsing report N+1 overlaps rendering report N.
+    
+    Args:
+        html_uploads: SpooledUploads in the order their reports appear in
+            the workbook; the caller closes them
+        layout: 'sheets' for one sheet per report, 'combined' for one sheet
+        cancel: Optional CancelToken; every report's rendering runs under the
+            'rendering' deadline and the save under the 'building' deadline.
+            Reports are parsed on child tokens, each under its own 'parsing'
+            deadline, since their parsing overlaps another report's rendering
+    
+    Returns:
+        Binary file object holding the workbook, positioned at the start
+    """
+    if cancel is None:
+        cancel = CancelToken()
+    logger.info(f"Processing batch of {len(html_uploads)} reports (outputs: {', '.join(outputs)}, layout: {layout})")
+    
+    def parse_report(html_upload):
+        # The shared token is in the previous report's 'rendering' stage meanwhile
+        parse_cancel = cancel.child()
+        with parse_cancel.stage('parsing', STAGE_TIMEOUTS['parsing']):
+            return parse_upload(html_upload, outputs, parse_cancel)
+    
+    reports = []
+    prefetch = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch-parse')
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        tables = soup.find_all('table')
-        
-        dataframes = []
-        
-        for i, table in enumerate(tables):
+        parsed = prefetch.submit(parse_report, html_uploads[0])
+        for index, html_upload in enumerate(html_uploads):
+            sections, data_sheets = wait_for_future(parsed, cancel)
+            if index + 1 < len(html_uploads):
+                parsed = prefetch.submit(parse_report, html_uploads[index + 1])
+            
+            images = None
+            if sections is not None:
+                with cancel.stage('rendering', STAGE_TIMEOUTS['rendering']):
+                    images = render_sections(sections, cancel)
+            logger.info(f"Batch report {index + 1}/{len(html_uploads)} done: {html_upload.filename}")
+            reports.append({
+                'name': os.path.splitext(html_upload.filename)[0],
+                'images': images,
+                'data_sheets': data_sheets
+            })
+    except OperationCancelled as e:
+        logger.warning(f"Cancelled batch processing: {str(e)}")
+        raise
+    finally:
+        prefetch.shutdown(wait=False, cancel_futures=True)
+    
+    with cancel.stage('building', STAGE_TIMEOUTS['building']):
+        offload = cpu_pool is not None and sum(upload.size for upload in html_uploads) >= CPU_OFFLOAD_THRESHOLD
+        return save_workbook(cancel, offload, build_batch_workbook, reports, layout)
+
+def parse_upload(html_upload, outputs, cancel, profile=NO_PROFILE):
+    """Run the requested extractors over an upload, in the process pool once it is large enough"""
+    offload = cpu_pool is not None and html_upload.size >= CPU_OFFLOAD_THRESHOLD and not profile.enabled
+    streaming = html_upload.size > STREAMING_THRESHOLD
+    # Spooled uploads reach the worker process as a path, so only small ones are pickled
+    html_source = html_upload.source()
+    if offload:
+        result, timings = run_cpu_stage(cancel, timed_call, extract_outputs, html_source, outputs, streaming, None,
+                                        html_upload.encoding)
+    else:
+        timings = {}
+        result = extract_outputs(html_source, outputs, streaming, cancel, html_upload.encoding, timings)
+    observe_stages(timings)
+    profile.record_steps(timings)
+    return result
+
+def render_sections(sections, cancel, progress=None, profile=NO_PROFILE):
+    """Screenshot the sections' boxes across pooled pages, reusing cached sections"""
+    with stage_seconds.time(stage='render'):
+        return capture_sections_images(
+            sections,
+            browser_pool=browser_pool,
+            shards=RENDER_SHARDS,
+            render_slots=render_slots,
+            allowed_hosts=RENDER_ALLOWED_HOSTS,
+            capture_mode=CAPTURE_MODE,
+            progress=progress,
+            # Profiled runs render every section, so the browser trace covers the whole report
+            image_cache=None if profile.enabled else section_image_cache,
+            cache_options={'viewport': browser_pool.context_options.get('viewport')},
+            cancel=cancel,
+            on_box=observe_box,
+            trace_dir=profile.trace_dir
+        )
+
+def save_workbook(cancel, offload, build, *args, profile=NO_PROFILE):
+    """
+    Run build(output, *args) and return the workbook as a file object at its start
+    
+    Offloaded builds run in the process pool and save straight to a temp
+    file, so the workbook is never pickled back; in-thread builds write to
+    a spooled temp file and can be cancelled between sheets.
+    """
+    if offload:
+        fd, workbook_path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            _, timings = run_cpu_stage(cancel, timed_call, build, workbook_path, *args)
+            observe_stages(timings)
+            profile.record_steps(timings)
+            return open(workbook_path, 'rb')
+        finally:
+            # The open file stays readable; the name is not needed any more
+            os.remove(workbook_path)
+    
+    excel_output = tempfile.SpooledTemporaryFile(max_size=WORKBOOK_SPOOL_BYTES, suffix='.xlsx')
+    timings = {}
+    build(excel_output, *args, cancel=cancel, timings=timings)
+    observe_stages(timings)
+    profile.record_steps(timings)
+    excel_output.seek(0)
+    return excel_output
+
+def run_cpu_stage(cancel, fn, *args):
+    """
+    Run fn(*args) in the CPU process pool and wait for its result
+    
+    Arguments and results are pickled, so they should be plain data such
+    as strings, bytes and lists. A running task cannot be interrupted, but
+    the caller stops waiting as soon as the token is cancelled.
+    """
+    return wait_for_future(cpu_pool.submit(fn, *args), cancel)
+
+def wait_for_future(future, cancel):
+    """Wait for a future's result, giving up (and cancelling it) once the token is cancelled"""
+    while True:
+        try:
+            return future.result(timeout=0.25)
+        except FutureTimeoutError:
             try:
-                # Extract table data efficiently
-                rows = []
-                headers = []
-                
-                # Find headers
-                header_row = table.find('thead')
-                if header_row:
-                    header_cells = header_row.find_all(['th', 'td'])
-                    headers = [cell.get_text(strip=True) for cell in header_cells]
-                else:
-                    first_row = table.find('tr')
-                    if first_row:
-                        first_row_cells = first_row.find_all(['th', 'td'])
-                        if any(cell.name == 'th' for cell in first_row_cells):
-                            headers = [cell.get_text(strip=True) for cell in first_row_cells]
-                
-                # Extract all rows efficiently
-                for row in table.find_all('tr'):
-                    cells = row.find_all(['td', 'th'])
-                    if cells:
-                        row_data = [cell.get_text(strip=True) for cell in cells]
-                        rows.append(row_data)
-                
-                if rows:
-                    # Skip header row if it matches
-                    if headers and len(rows) > 0 and len(headers) == len(rows[0]):
-                        if headers == rows[0]:
-                            rows = rows[1:]
-                    
-                    # Create DataFrame with error handling
-                    if headers and len(headers) > 0:
-                        max_cols = len(headers)
-                        for j, row in enumerate(rows):
-                            while len(row) < max_cols:
-                                row.append('')
-                            rows[j] = row[:max_cols]
-                        
-                        df = pd.DataFrame(rows, columns=headers)
-                    else:
-                        df = pd.DataFrame(rows)
-                    
-                    dataframes.append({
-                        'data': df,
-                        'title': f'Table_{i+1}',
-                        'index': i
-                    })
-                    
-            except Exception as e:
-                logger.warning(f"Error processing table {i}: {str(e)}")
-                continue
-        
-        # Clean up BeautifulSoup object
-        soup.decompose()
-        return dataframes
-        
-    except Exception as e:
-        logger.error(f"Error in table extraction: {str(e)}")
-        return []
+                cancel.check()
+            except OperationCancelled:
+                future.cancel()
+                raise
 
-def extract_text_content(html_content):
-    """Extract text content with memory optimization"""
+def read_upload():
+    """
+    Validate the uploaded HTML file and processing options of the current request
+    
+    The file is copied out of the request as raw bytes (spooled to a temp
+    file past UPLOAD_SPOOL_BYTES) and never decoded here; the parsers read
+    the bytes with the encoding sniffed from its BOM or <meta charset>.
+    
+    Returns:
+        (upload, None) with the SpooledUpload content, filename, outputs and
+        size, or (None, error_response) when the request is invalid; the
+        caller closes upload['content']
+    """
+    # Validate request
+    if 'html_file' not in request.files:
+        return None, (jsonify({'error': 'No file uploaded', 'code': 'NO_FILE'}), 400)
+    
+    file = request.files['html_file']
+    
+    if file.filename == '':
+        return None, (jsonify({'error': 'No file selected', 'code': 'EMPTY_FILENAME'}), 400)
+    
+    # Check file size
+    file.seek(0, os.SEEK_END)
+    file_size = file.tell()
+    file.seek(0)
+    
+    if file_size > MAX_FILE_SIZE:
+        return None, (jsonify({
+            'error': f'File size ({file_size} bytes) exceeds limit ({MAX_FILE_SIZE} bytes)',
+            'code': 'FILE_TOO_LARGE'
+        }), 413)
+    
+    # Sheets to produce, e.g. outputs=images,tables
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        content_data = []
+        outputs = parse_outputs(request.form.get('outputs') or request.args.get('outputs'))
+    except ValueError as e:
+        return None, (jsonify({'error': str(e), 'code': 'INVALID_OUTPUTS'}), 400)
+    
+    if file_size > STREAMING_THRESHOLD and not set(outputs) <= set(STREAMING_OUTPUTS):
+        return None, (jsonify({
+            'error': f'Files over {STREAMING_THRESHOLD} bytes only support outputs: {", ".join(STREAMING_OUTPUTS)}',
+            'code': 'OUTPUT_NOT_SUPPORTED'
+        }), 400)
+    
+    # Copy the raw bytes in chunks, hashing them on the way
+    try:
+        with stage_seconds.time(stage='upload_read'):
+            content = SpooledUpload(file.stream, file.filename, spool_bytes=UPLOAD_SPOOL_BYTES, max_bytes=MAX_FILE_SIZE)
+    except UploadTooLarge:
+        return None, (jsonify({
+            'error': f'File exceeds limit ({MAX_FILE_SIZE} bytes)',
+            'code': 'FILE_TOO_LARGE'
+        }), 413)
+    upload_bytes.inc(content.size)
+    
+    return {
+        'content': content,
+        'filename': file.filename,
+        'outputs': outputs,
+        'file_size': content.size,
+        'cache_key': ResultCache.make_key(content.content_hash, **processing_options(outputs))
+    }, None
+
+def read_batch_upload():
+    """
+    Validate the HTML files (or zip archives of them) and options of a batch request
+    
+    Returns:
+        (batch, None) with the SpooledUpload contents in upload order, the
+        outputs, layout and cache key, or (None, error_response); the caller
+        closes batch['contents']
+    """
+    files = [file for file in request.files.getlist('html_files') if file.filename]
+    if not files:
+        return None, (jsonify({'error': 'No files uploaded', 'code': 'NO_FILE'}), 400)
+    
+    try:
+        outputs = parse_outputs(request.form.get('outputs') or request.args.get('outputs'))
+    except ValueError as e:
+        return None, (jsonify({'error': str(e), 'code': 'INVALID_OUTPUTS'}), 400)
+    
+    layout = (request.form.get('layout') or request.args.get('layout') or 'sheets').strip().lower()
+    if layout not in BATCH_LAYOUTS:
+        return None, (jsonify({
+            'error': f"Unknown layout {layout!r}; choose from {', '.join(BATCH_LAYOUTS)}",
+            'code': 'INVALID_LAYOUT'
+        }), 400)
+    
+    contents = []
+    started = time.perf_counter()
+    try:
+        for file in files:
+            remaining = MAX_BATCH_SIZE - sum(content.size for content in contents)
+            if file.filename.lower().endswith('.zip'):
+                contents.extend(read_html_archive(
+                    file.stream,
+                    spool_bytes=UPLOAD_SPOOL_BYTES,
+                    max_bytes=remaining,
+                    max_files=MAX_BATCH_FILES - len(contents)
+                ))
+            else:
+                contents.append(SpooledUpload(file.stream, file.filename, spool_bytes=UPLOAD_SPOOL_BYTES,
+                                              max_bytes=remaining))
+            if len(contents) > MAX_BATCH_FILES:
+                raise ValueError(f"A batch holds at most {MAX_BATCH_FILES} reports")
         
-        # Extract title
-        title = soup.find('title')
-        if title:
-            content_data.append(['Title', title.get_text(strip=True)])
+        if not contents:
+            raise ValueError("No HTML files found in the upload")
+        stage_seconds.observe(time.perf_counter() - started, stage='upload_read')
+        upload_bytes.inc(sum(content.size for content in contents))
+    except UploadTooLarge:
+        for content in contents:
+            content.close()
+        return None, (jsonify({
+            'error': f'Batch exceeds limit ({MAX_BATCH_SIZE} bytes)',
+            'code': 'FILE_TOO_LARGE'
+        }), 413)
+    except ValueError as e:
+        for content in contents:
+            content.close()
+        return None, (jsonify({'error': str(e), 'code': 'INVALID_BATCH'}), 400)
+    
+    large = [content.filename for content in contents if content.size > STREAMING_THRESHOLD]
+    if large and not set(outputs) <= set(STREAMING_OUTPUTS):
+        for content in contents:
+            content.close()
+        return None, (jsonify({
+            'error': f'Files over {STREAMING_THRESHOLD} bytes only support outputs: {", ".join(STREAMING_OUTPUTS)} '
+                     f'({", ".join(large)})',
+            'code': 'OUTPUT_NOT_SUPPORTED'
+        }), 400)
+    
+    # Names are part of the key: they become the sheet titles
+    batch_hash = hashlib.sha256(
+        '\n'.join(f"{content.filename}:{content.content_hash}" for content in contents).encode('utf-8')
+    ).hexdigest()
+    return {
+        'contents': contents,
+        'outputs': outputs,
+        'layout': layout,
+        'cache_key': ResultCache.make_key(batch_hash, layout=layout, **processing_options(outputs))
+    }, None
+
+def processing_options(outputs):
+    """Every setting that changes the generated workbook, for the result cache key"""
+    return {
+        'outputs': sorted(outputs),
+        'class_selector': '.image-box',
+        'heading_tag': SECTION_HEADING_TAG,
+        'marker_text': SECTION_MARKER_TEXT,
+        'capture_mode': CAPTURE_MODE,
+        'viewport': browser_pool.context_options.get('viewport'),
+        'allowed_hosts': sorted(RENDER_ALLOWED_HOSTS)
+    }
+
+def output_filename(filename):
+    """Download name of the workbook generated from an uploaded file"""
+    original_name = os.path.splitext(filename)[0]
+    return f"{original_name}_processed.xlsx"
+
+def send_workbook(output, filename):
+    """Stream a workbook file object in chunks; it is closed once the response is sent"""
+    size = output.seek(0, os.SEEK_END)
+    output.seek(0)
+    response = send_file(
+        output,
+        as_attachment=True,
+        download_name=output_filename(filename),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response.content_length = size
+    workbook_bytes.inc(size)
+    return response
+
+def cache_workbook(cache_key, output):
+    """Store a generated workbook in the result cache and rewind it for sending"""
+    result_cache.put_file(cache_key, output)
+    output.seek(0)
+
+@app.route('/process', methods=['POST'])
+@profiling_gate
+def process_html():
+    try:
+        # Non-admins asking for a profile were already turned away by profiling_gate
+        profiling, _ = read_profile_flag()
         
-        # Extract headings
-        headings = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
-        for heading in headings:
-            level = heading.name.upper()
-            text = heading.get_text(strip=True)
-            if text:
-                content_data.append([f'{level}', text])
+        started = time.perf_counter()
+        upload, error = read_upload()
+        if error:
+            return error
         
-        # Extract paragraphs (limit to prevent memory issues)
-        paragraphs = soup.find_all('p')[:100]  # Limit to first 100 paragraphs
-        for i, p in enumerate(paragraphs):
-            text = p.get_text(strip=True)
-            if text:
-                content_data.append([f'Paragraph_{i+1}', text[:500]])  # Limit text length
+        with upload['content']:
+            # Repeat uploads of the same report are served from the cache without waiting for a processing slot;
+            # profiled ones always convert
+            cached = None if profiling else result_cache.get(upload['cache_key'])
+            if cached is not None:
+                logger.info(f"Result cache hit for {upload['filename']}")
+                return send_workbook(io.BytesIO(cached), upload['filename'])
+            
+            return convert_upload(upload, profiling, started)
         
-        # Extract lists (limit to prevent memory issues)
-        lists = soup.find_all(['ul', 'ol'])[:20]  # Limit to first 20 lists
-        for i, lst in enumerate(lists):
-            list_type = 'Ordered List' if lst.name == 'ol' else 'Unordered List'
-            items = lst.find_all('li')[:20]  # Limit items per list
-            for j, item in enumerate(items):
-                text = item.get_text(strip=True)
-                if text:
-                    content_data.append([f'{list_type}_{i+1}_Item_{j+1}', text[:200]])
+    except Exception as e:
+        logger.error(f"Error in process_html: {str(e)}")
+        return jsonify({
+            'error': f'Processing failed: {str(e)}',
+            'code': 'PROCESSING_ERROR'
+        }), 500
+
+@admission_control
+def convert_upload(upload, profiling, started):
+    """Convert a /process upload that missed the result cache, once admitted"""
+    profile = NO_PROFILE
+    try:
+        if profiling:
+            profile = profile_store.create(started=started)
+            profile.record_steps({'upload_read': time.perf_counter() - started})
         
-        # Extract links (limit to prevent memory issues)
-        links = soup.find_all('a', href=True)[:50]  # Limit to first 50 links
-        for i, link in enumerate(links):
-            text = link.get_text(strip=True)
-            href = link['href']
-            if text and href:
-                content_data.append([f'Link_{i+1}_Text', text[:100]])
-                content_data.append([f'Link_{i+1}_URL', href[:200]])
+        # Process in thread pool
+        cancel = CancelToken(timeout=REQUEST_TIMEOUT)
+        future = executor.submit(process_html_content, upload['content'], upload['filename'], upload['outputs'],
+                                 cancel=cancel, profile=profile)
         
-        soup.decompose()
-        return content_data
+        try:
+            # Wait for processing with timeout
+            output = future.result(timeout=REQUEST_TIMEOUT)
+            cache_workbook(upload['cache_key'], output)
+            
+            return with_profile_id(send_workbook(output, upload['filename']), profile)
+            
+        except (FutureTimeoutError, OperationCancelled):
+            # Stop the worker too, so its pages are closed and its browser slots freed
+            cancel.cancel('request timed out')
+            if future.cancel():
+                # Never started, so the worker will not finish the profile
+                profile.finish('cancelled', 'request timed out')
+            timeouts.inc(endpoint='/process')
+            return with_profile_id((jsonify({
+                'error': 'Processing timeout. File may be too complex.',
+                'code': 'TIMEOUT'
+            }), 408), profile)
         
     except Exception as e:
-        logger.error(f"Error in text extraction: {str(e)}")
-        return []
+        logger.error(f"Error in process_html: {str(e)}")
+        return with_profile_id((jsonify({
+            'error': f'Processing failed: {str(e)}',
+            'code': 'PROCESSING_ERROR'
+        }), 500), profile)
 
-def extract_meta_information(html_content):
-    """Extract meta information with error handling"""
+@app.route('/batch', methods=['POST'])
+@profiling_gate
+def process_batch():
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        meta_data = []
-        
-        # Extract meta tags
-        meta_tags = soup.find_all('meta')
-        for meta in meta_tags:
-            try:
-                if meta.get('name'):
-                    content = meta.get('content', '')[:500]  # Limit content length
-                    meta_data.append([f'Meta_{meta["name"]}', content])
-                elif meta.get('property'):
-                    content = meta.get('content', '')[:500]
-                    meta_data.append([f'Property_{meta["property"]}', content])
-            except Exception:
-                continue
+        batch, error = read_batch_upload()
+        if error:
+            return error
         
-        soup.decompose()
-        return meta_data
+        try:
+            # Like /process, a repeated batch is served from the cache without waiting for a processing slot
+            cached = result_cache.get(batch['cache_key'])
+            if cached is not None:
+                logger.info(f"Result cache hit for batch of {len(batch['contents'])} reports")
+                return send_workbook(io.BytesIO(cached), BATCH_FILENAME)
+            
+            return convert_batch(batch)
+        finally:
+            for content in batch['contents']:
+                content.close()
         
     except Exception as e:
-        logger.error(f"Error in meta extraction: {str(e)}")
-        return []
+        logger.error(f"Error in process_batch: {str(e)}")
+        return jsonify({
+            'error': f'Batch processing failed: {str(e)}',
+            'code': 'PROCESSING_ERROR'
+        }), 500
 
-@app.route('/process', methods=['POST'])
-@rate_limit
-def process_html():
+@admission_control
+def convert_batch(batch):
+    """Convert a /batch upload that missed the result cache, once admitted"""
     try:
-        # Validate request
-        if 'html_file' not in request.files:
-            return jsonify({'error': 'No file uploaded', 'code': 'NO_FILE'}), 400
+        cancel = CancelToken(timeout=BATCH_TIMEOUT)
+        future = executor.submit(process_html_batch, batch['contents'], batch['outputs'], batch['layout'],
+                                 cancel=cancel)
         
-        file = request.files['html_file']
+        try:
+            output = future.result(timeout=BATCH_TIMEOUT)
+            cache_workbook(batch['cache_key'], output)
+            
+            return send_workbook(output, BATCH_FILENAME)
+            
+        except (FutureTimeoutError, OperationCancelled):
+            cancel.cancel('request timed out')
+            future.cancel()
+            timeouts.inc(endpoint='/batch')
+            return jsonify({
+                'error': 'Batch processing timeout. Try fewer or smaller reports.',
+                'code': 'TIMEOUT'
+            }), 408
         
-        if file.filename == '':
-            return jsonify({'error': 'No file selected', 'code': 'EMPTY_FILENAME'}), 400
+    except Exception as e:
+        logger.error(f"Error in process_batch: {str(e)}")
+        return jsonify({
+            'error': f'Batch processing failed: {str(e)}',
+            'code': 'PROCESSING_ERROR'
+        }), 500
+
+def run_job(job, html_upload, cache_key, ticket, profile=None):
+    """Run an admitted job on the thread pool and keep its result in the job store"""
+    stage_seconds.observe(ticket.waited, stage='queue_wait')
+    if profile is not None:
+        profile.record_steps({'queue_wait': ticket.waited})
+    try:
+        # Jobs are not bound by REQUEST_TIMEOUT, only by the per-stage deadlines
+        with process_html_content(html_upload, job.filename, job.outputs, progress=job.report_progress,
+                                  profile=profile) as output:
+            cache_workbook(cache_key, output)
+            # The job keeps its workbook as a file until it expires, not as bytes
+            job_store.complete(job, output)
+        logger.info(f"Job {job.id} finished")
+    except Exception as e:
+        logger.error(f"Job {job.id} failed: {str(e)}")
+        if isinstance(e, OperationCancelled):
+            timeouts.inc(endpoint='/jobs')
+        job.fail(str(e))
+    finally:
+        html_upload.close()
+        ticket.release()
+        gc.collect()
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        profiling, error = read_profile_flag()
+        if error:
+            return error
         
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
+        started = time.perf_counter()
+        upload, error = read_upload()
+        if error:
+            return error
+        read_seconds = time.perf_counter() - started
         
-        if file_size > MAX_FILE_SIZE:
+        if job_store.pending_count() >= MAX_PENDING_JOBS:
+            upload['content'].close()
+            busy_responses.inc(code='SERVER_BUSY')
             return jsonify({
-                'error': f'File size ({file_size} bytes) exceeds limit ({MAX_FILE_SIZE} bytes)',
-                'code': 'FILE_TOO_LARGE'
-            }), 413
+                'error': 'Too many jobs in progress. Please try again in a moment.',
+                'code': 'SERVER_BUSY'
+            }), 503
         
-        # Read HTML content with encoding handling
-        try:
-            html_content = file.read().decode('utf-8', errors='ignore')
-        except UnicodeDecodeError:
+        # Profiled jobs always convert
+        cached = None if profiling else result_cache.get(upload['cache_key'])
+        ticket = None
+        if cached is None:
             try:
-                file.seek(0)
-                html_content = file.read().decode('latin-1', errors='ignore')
-            except:
-                return jsonify({
-                    'error': 'Unable to decode file content',
-                    'code': 'ENCODING_ERROR'
-                }), 400
+                ticket = admission.enter(upload['file_size'])
+            except QueueFull:
+                upload['content'].close()
+                return busy_response('Server is busy. Please try again in a moment.')
         
-        # Process in thread pool
-        future = executor.submit(process_html_content, html_content, file.filename)
+        job = job_store.create(upload['filename'], upload['outputs'])
+        profile = None
+        if profiling:
+            # Stored under the job id, so the slow job's profile is found by the id its client already has
+            profile = profile_store.create(job.id, started=started)
+            profile.record_steps({'upload_read': read_seconds})
+        if cached is not None:
+            logger.info(f"Result cache hit for {upload['filename']}, job {job.id} is already done")
+            upload['content'].close()
+            job_store.complete(job, io.BytesIO(cached))
+        else:
+            # The job takes a worker thread only once admitted; until then it waits in the queue
+            job.ticket = ticket
+            ticket.on_admit(lambda: executor.submit(run_job, job, upload['content'], upload['cache_key'], ticket,
+                                                    profile))
+            logger.info(f"Queued job {job.id} for {upload['filename']} (queue position {ticket.initial_position})")
         
-        try:
-            # Wait for processing with timeout
-            output = future.result(timeout=REQUEST_TIMEOUT)
-            
-            # Generate output filename
-            original_name = os.path.splitext(file.filename)[0]
-            output_filename = f"{original_name}_processed.xlsx"
-            
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=output_filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            
-        except TimeoutError:
-            return jsonify({
-                'error': 'Processing timeout. File may be too complex.',
-                'code': 'TIMEOUT'
-            }), 408
+        response = {
+            'job_id': job.id,
+            'status': job.status,
+            'queue_position': ticket.position if ticket is not None else 0,
+            'status_url': f'/jobs/{job.id}',
+            'result_url': f'/jobs/{job.id}/result'
+        }
+        if profile is not None:
+            response['profile_url'] = f'/profiles/{job.id}'
+        return jsonify(response), 202
         
     except Exception as e:
-        logger.error(f"Error in process_html: {str(e)}")
+        logger.error(f"Error in submit_job: {str(e)}")
         return jsonify({
-            'error': f'Processing failed: {str(e)}',
+            'error': f'Job submission failed: {str(e)}',
             'code': 'PROCESSING_ERROR'
         }), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job', 'code': 'JOB_NOT_FOUND'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job', 'code': 'JOB_NOT_FOUND'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': f'Processing failed: {job.error}', 'code': 'PROCESSING_ERROR'}), 500
+    if job.status != 'done':
+        return jsonify({'error': 'Job is not finished yet', 'code': 'JOB_NOT_READY', 'status': job.status}), 409
+    try:
+        result = open(job.result_path, 'rb')
+    except OSError:
+        # Expired in the meantime
+        return jsonify({'error': 'Unknown or expired job', 'code': 'JOB_NOT_FOUND'}), 404
+    return send_workbook(result, job.filename)
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def profile_summary(profile_id):
+    summary = profile_store.summary(profile_id)
+    if summary is None:
+        return jsonify({'error': 'Unknown or expired profile', 'code': 'PROFILE_NOT_FOUND'}), 404
+    return jsonify(summary)
+
+@app.route('/profiles/<profile_id>/<artifact>', methods=['GET'])
+@admin_required
+def profile_artifact(profile_id, artifact):
+    path = profile_store.artifact_path(profile_id, artifact)
+    if path is None:
+        return jsonify({'error': 'Unknown profile file', 'code': 'PROFILE_NOT_FOUND'}), 404
+    return send_file(path, as_attachment=True, download_name=f"{profile_id}-{artifact}")
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    with request_lock:
-        active_count = len(active_requests)
+    stats = admission.stats()
     
     return jsonify({
         'status': 'Server is running',
         'message': 'HTML to Excel converter is ready',
-        'active_requests': active_count,
-        'max_concurrent': MAX_CONCURRENT_REQUESTS,
-        'server_load': f"{(active_count/MAX_CONCURRENT_REQUESTS)*100:.1f}%"
+        'active_requests': stats['running'],
+        'queued_requests': stats['queued'],
+        'max_concurrent': stats['capacity'],
+        'server_load': f"{(stats['running']/stats['capacity'])*100:.1f}%"
     })
 
 @app.route('/status', methods=['GET'])
 def server_status():
-    with request_lock:
-        active_count = len(active_requests)
+    stats = admission.stats()
     
     return jsonify({
         'server_info': {
-            'active_requests': active_count,
-            'max_concurrent_requests': MAX_CONCURRENT_REQUESTS,
+            'active_requests': stats['running'],
+            'queued_requests': stats['queued'],
+            'max_concurrent_requests': stats['capacity'],
             'max_workers': MAX_WORKERS,
-            'server_load_percentage': round((active_count/MAX_CONCURRENT_REQUESTS)*100, 1),
-            'available_slots': MAX_CONCURRENT_REQUESTS - active_count
+            'cpu_workers': CPU_WORKERS,
+            'server_load_percentage': round((stats['running']/stats['capacity'])*100, 1),
+            'available_slots': max(0, stats['capacity'] - stats['running'])
         },
+        'admission': stats,
+        'browser_pool': browser_pool.stats(),
+        'jobs': job_store.stats(),
+        'result_cache': result_cache.stats(),
+        'section_cache': section_image_cache.stats(),
         'limits': {
             'max_file_size_mb': MAX_FILE_SIZE / (1024*1024),
             'request_timeout_seconds': REQUEST_TIMEOUT
         }
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.after_request
+def count_request(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    requests_total.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({
         'message': 'HTML to Excel Converter API - Production Ready',
         'endpoints': {
-            '/process': 'POST - Upload HTML file for processing',
+            '/process': 'POST - Upload HTML file for processing (optional outputs=images,tables,text,meta)',
+            '/batch': 'POST - Convert several HTML files or zips (html_files) into one workbook',
+            '/jobs': 'POST - Queue an HTML file for processing, returns a job id immediately',
+            '/jobs/<job_id>': 'GET - Job status and progress',
+            '/jobs/<job_id>/result': 'GET - Download the finished workbook',
             '/health': 'GET - Health check',
-            '/status': 'GET - Detailed server status'
+            '/status': 'GET - Detailed server status',
+            '/metrics': 'GET - Prometheus metrics',
+            '/profiles/<id>': 'GET - Profile of a request sent with X-Profile: 1 (admin token required)'
         },
         'features': {
-            'concurrent_users': f'Up to {MAX_CONCURRENT_REQUESTS} concurrent requests',
+            'concurrent_users': f'Up to {admission.capacity} concurrent requests, {ADMISSION_QUEUE_SIZE} more queued',
             'max_file_size': f'{MAX_FILE_SIZE/(1024*1024)}MB',
             'thread_pool_workers': MAX_WORKERS
         }
     })
 
+def start_services():
+    """Warm up the browsers of this server process and close them again at exit"""
+    browser_pool.start()
+    metrics.start()
+    atexit.register(stop_services)
+
+def stop_services():
+    """Close the browsers and worker pools of this server process; safe to call twice"""
+    # Queued conversions are dropped first; ones still running fail at their next render instead of relaunching browsers
+    executor.shutdown(wait=False, cancel_futures=True)
+    browser_pool.shutdown()
+    metrics.stop()
+    if cpu_pool is not None:
+        cpu_pool.shutdown()
+
+def create_app():
+    """
+    App factory for production WSGI servers, e.g.
+    gunicorn 'html2image2excel_backend:create_app()' (see gunicorn.conf.py)
+    
+    Call it in each worker process after the fork: the process gets its own
+    browsers, thread pools and caches.
+    """
+    start_services()
+    return app
+
 # Custom request handler to improve performance
 class ThreadedWSGIRequestHandler(WSGIRequestHandler):
     def handle(self):
@@ -412,22 +1050,34 @@ if __name__ == '__main__':
     print("HTML to Excel Converter Server - Production Ready")
     print("=" * 60)
     print(f"Server Configuration:")
-    print(f"  • Max Concurrent Users: {MAX_CONCURRENT_REQUESTS}")
+    print(f"  • Max Concurrent Users: {admission.capacity} (+{ADMISSION_QUEUE_SIZE} queued)")
     print(f"  • Thread Pool Workers: {MAX_WORKERS}")
+    print(f"  • CPU Worker Processes: {CPU_WORKERS}")
+    if RENDER_ENGINE == 'async':
+        print(f"  • Render Engine: async, {ASYNC_BROWSERS} browsers, {ASYNC_MAX_PAGES} pages")
+    else:
+        print(f"  • Browser Pool Size: {BROWSER_POOL_SIZE}")
     print(f"  • Max File Size: {MAX_FILE_SIZE/(1024*1024)}MB")
     print(f"  • Request Timeout: {REQUEST_TIMEOUT}s")
     print("=" * 60)
     print("Server will run on http://localhost:5000")
     print("Available endpoints:")
     print("  • POST /process - Upload HTML file for conversion")
+    print("  • POST /batch - Convert several HTML files or zips into one workbook")
+    print("  • POST /jobs - Queue a conversion; poll GET /jobs/<id>, download GET /jobs/<id>/result")
     print("  • GET /health - Health check with load info")
     print("  • GET /status - Detailed server status")
+    print("  • GET /metrics - Prometheus metrics")
     print("  • GET / - API information")
     print("=" * 60)
     print("Required dependencies:")
     print("  pip install flask flask-cors beautifulsoup4 pandas openpyxl")
+    print("Development server; for production run: gunicorn -c gunicorn.conf.py")
     print("=" * 60)
     
+    # Warm up the browsers before accepting requests
+    start_services()
+
     # Run with threading enabled
     app.run(
         debug=False,  # Disabled for production
@@ -0,0 +1,290 @@
+"""
+Headless batch converter: HTML reports to Excel workbooks without the Flask server
+
+Files, directories and glob patterns are converted in parallel, one report
+per browser worker. Inputs whose size, mtime (or, failing that, content hash)
+and options match the manifest of a previous run are skipped. Per-file
+timings are printed as files finish, and the exit status is 1 when any
+conversion failed, so the command can gate a CI job.
+
+    python html2image2excel_cli.py reports/ 'build/**/*.html' -o xlsx --workers 4
+    python html2image2excel_cli.py report.html --outputs images,tables --report timings.json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from browser_pool import BrowserPool
+from cancellation import CancelToken
+from extraction import extract_outputs
+from services import (OUTPUT_SHEETS, STREAMING_OUTPUTS, STREAMING_THRESHOLD, build_workbook, capture_sections_images,
+                      parse_outputs)
+from uploads import HTML_SUFFIXES, SNIFF_BYTES, sniff_encoding
+
+MANIFEST_NAME = '.html2excel-manifest.json'  # Written to the output directory (or the current one)
+CAPTURE_MODES = ('batch', 'element')
+
+
+def _default_file_mode():
+    # The umask can only be read by replacing it; this runs once at import, before any worker thread starts
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Mode of the files written here; mkstemp creates its temp files 0600
+FILE_MODE = _default_file_mode()
+
+
+def find_inputs(patterns, recursive=False):
+    """
+    Absolute paths of the HTML files named by files, directories or glob patterns
+
+    Directories contribute their .html/.htm files (and those of their
+    subdirectories with `recursive`). The result is sorted and free of
+    duplicates.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            directory = os.path.join(pattern, '**') if recursive else pattern
+            matches = [path for suffix in HTML_SUFFIXES
+                       for path in glob.glob(os.path.join(directory, f'*{suffix}'), recursive=True)]
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = [path for path in glob.glob(pattern, recursive=True) if path.lower().endswith(HTML_SUFFIXES)]
+        paths.update(os.path.abspath(path) for path in matches if os.path.isfile(path))
+    return sorted(paths)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Record of converted inputs, used to skip unchanged ones on the next run
+
+    Entries are keyed by the input path relative to the manifest and hold
+    its size, mtime, SHA-256, the workbook path and the options used. An
+    input whose mtime changed (e.g. after a fresh checkout) but whose
+    content did not is still skipped.
+
+    Args:
+        path: JSON file to load and save; a missing file is an empty manifest
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.entries = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def is_current(self, input_path, output_path, options):
+        """True when the input was converted with these options and is unchanged since"""
+        entry = self.entries.get(self._key(input_path))
+        if (entry is None or entry.get('options') != options or entry.get('output') != self._key(output_path)
+                or not os.path.exists(output_path)):
+            return False
+        stat = os.stat(input_path)
+        if stat.st_size != entry.get('size'):
+            return False
+        if stat.st_mtime_ns == entry.get('mtime_ns'):
+            return True
+        if file_digest(input_path) != entry.get('sha256'):
+            return False
+        # Same content under a new mtime; remember it so the next run skips the hash
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def record(self, input_path, output_path, options, sha256):
+        stat = os.stat(input_path)
+        self.entries[self._key(input_path)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256,
+            'output': self._key(output_path),
+            'options': options
+        }
+
+    def save(self):
+        """Write the manifest atomically, so an interrupted run never leaves it truncated"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.chmod(temp_path, FILE_MODE)
+        os.replace(temp_path, self.path)
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), os.path.dirname(self.path))
+
+
+def output_path_for(input_path, output_dir=None):
+    """Workbook path of an input: <name>_processed.xlsx in output_dir, or next to the input"""
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir or os.path.dirname(input_path), f"{name}_processed.xlsx")
+
+
+def convert_file(input_path, output_path, outputs, browser_pool=None, capture_mode='batch', timeout=None):
+    """
+    Convert one HTML file into a workbook, the same way the server converts an upload
+
+    The workbook is written to a temp file next to output_path and renamed
+    into place, so a failed or interrupted conversion never leaves a
+    partial workbook behind.
+
+    Returns:
+        Dict with the content hash and the seconds spent parsing, rendering,
+        saving and in total
+    """
+    cancel = CancelToken(timeout=timeout)
+    size = os.path.getsize(input_path)
+    streaming = size > STREAMING_THRESHOLD
+    if streaming and not set(outputs) <= set(STREAMING_OUTPUTS):
+        raise ValueError(f"Files over {STREAMING_THRESHOLD} bytes only support outputs: {', '.join(STREAMING_OUTPUTS)}")
+
+    start = time.perf_counter()
+    sha256 = file_digest(input_path)
+    with open(input_path, 'rb') as f:
+        encoding = sniff_encoding(f.read(SNIFF_BYTES))
+    sections, data_sheets = extract_outputs(Path(input_path), outputs, streaming, cancel, encoding)
+    parsed = time.perf_counter()
+
+    images = None
+    if sections is not None:
+        images = capture_sections_images(sections, browser_pool=browser_pool, capture_mode=capture_mode,
+                                         cancel=cancel)
+    rendered = time.perf_counter()
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.xlsx.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            build_workbook(f, images, data_sheets, cancel=cancel)
+        os.chmod(temp_path, FILE_MODE)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    saved = time.perf_counter()
+
+    return {
+        'sha256': sha256,
+        'sections': len(sections) if sections is not None else None,
+        'parse_seconds': round(parsed - start, 3),
+        'render_seconds': round(rendered - parsed, 3),
+        'save_seconds': round(saved - rendered, 3),
+        'total_seconds': round(saved - start, 3)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='HTML files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir', help='Directory for the workbooks (default: next to each input)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='Include subdirectories of input directories')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='Reports converted at once, one browser each')
+    parser.add_argument('--outputs', default='images', help=f"Comma-separated sheets: {', '.join(OUTPUT_SHEETS)}")
+    parser.add_argument('--capture-mode', choices=CAPTURE_MODES, default='batch')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds allowed per file')
+    parser.add_argument('--manifest', help=f'Manifest path (default: {MANIFEST_NAME} in the output directory)')
+    parser.add_argument('--force', action='store_true', help='Convert every input, even unchanged ones')
+    parser.add_argument('--report', help='Write per-file results and timings to this JSON file')
+    args = parser.parse_args(argv)
+
+    try:
+        args.outputs = parse_outputs(args.outputs)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    inputs = find_inputs(args.inputs, args.recursive)
+    if not inputs:
+        print("❌ No HTML files found")
+        return 1
+
+    targets = {path: output_path_for(path, args.output_dir) for path in inputs}
+    if len(set(targets.values())) < len(targets):
+        print("❌ Several inputs map to the same workbook name; convert them into separate output directories")
+        return 1
+
+    manifest = Manifest(args.manifest or os.path.join(args.output_dir or '.', MANIFEST_NAME))
+    options = {'outputs': sorted(args.outputs), 'capture_mode': args.capture_mode}
+    results = []
+    pending = []
+    for path in inputs:
+        if not args.force and manifest.is_current(path, targets[path], options):
+            print(f"⏭️ Unchanged: {path}")
+            results.append({'input': path, 'output': targets[path], 'status': 'skipped'})
+        else:
+            pending.append(path)
+
+    print(f"📂 {len(pending)} of {len(inputs)} files to convert with {args.workers} workers")
+    browser_pool = BrowserPool(size=args.workers) if pending and 'images' in args.outputs else None
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = {
+                pool.submit(convert_file, path, targets[path], args.outputs, browser_pool, args.capture_mode,
+                            args.timeout): path
+                for path in pending
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                result = {'input': path, 'output': targets[path]}
+                try:
+                    timings = future.result()
+                except Exception as e:
+                    print(f"❌ Failed: {path}: {e}")
+                    result.update(status='failed', error=str(e))
+                else:
+                    manifest.record(path, targets[path], options, timings.pop('sha256'))
+                    print(f"✅ {path}: parse {timings['parse_seconds']:.2f}s, "
+                          f"render {timings['render_seconds']:.2f}s, save {timings['save_seconds']:.2f}s, "
+                          f"total {timings['total_seconds']:.2f}s")
+                    result.update(status='converted', **timings)
+                results.append(result)
+    finally:
+        if browser_pool is not None:
+            browser_pool.shutdown()
+        manifest.save()
+    elapsed = time.perf_counter() - start
+
+    counts = {status: sum(1 for result in results if result['status'] == status)
+              for status in ('converted', 'skipped', 'failed')}
+    print(f"🎉 {counts['converted']} converted, {counts['skipped']} unchanged, {counts['failed']} failed "
+          f"in {elapsed:.2f}s")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed_seconds': round(elapsed, 3), 'workers': args.workers, 'files': results}, f, indent=2)
+
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
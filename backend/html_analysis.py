@@ -0,0 +1,63 @@
+import heapq
+from collections import defaultdict
+
+from bs4 import BeautifulSoup
+
+
+class HtmlDocument:
+    """
+    Single parse of an uploaded HTML report shared by every extractor
+
+    The tree is built once (lxml by default) and walked once to index the
+    elements the extractors need, so extract_tables_from_html,
+    extract_text_content, extract_meta_information and build_extracted_html
+    all read from the same tree instead of re-parsing the upload.
+
+    Args:
+        html_content: HTML markup (str or bytes)
+        parser: BeautifulSoup tree builder to use
+        encoding: Encoding of byte markup, e.g. from uploads.sniff_encoding(); ignored for str
+    """
+
+    INDEXED_TAGS = frozenset([
+        'title', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'a', 'table', 'meta'
+    ])
+
+    def __init__(self, html_content, parser='lxml', encoding=None):
+        if isinstance(html_content, str):
+            encoding = None
+        self.soup = BeautifulSoup(html_content, parser, from_encoding=encoding)
+        self._index = defaultdict(list)
+
+        # One traversal of the whole tree; positions keep document order across tags
+        indexed_tags = self.INDEXED_TAGS
+        for position, element in enumerate(self.soup.descendants):
+            name = element.name
+            if name in indexed_tags:
+                self._index[name].append((position, element))
+
+    def find_all(self, *names):
+        """Indexed elements with any of the given tag names, in document order"""
+        if not self.INDEXED_TAGS.issuperset(names):
+            return self.soup.find_all(list(names))
+        if len(names) == 1:
+            return [element for _, element in self._index.get(names[0], ())]
+        merged = heapq.merge(*(self._index.get(name, ()) for name in names), key=lambda item: item[0])
+        return [element for _, element in merged]
+
+    def find(self, name):
+        """First indexed element with the given tag name, or None"""
+        elements = self._index.get(name)
+        return elements[0][1] if elements else None
+
+    def decompose(self):
+        """Free the parse tree once every extractor is done with it"""
+        self._index.clear()
+        self.soup.decompose()
+
+
+def as_html_document(source):
+    """Return source unchanged if it is already an HtmlDocument, otherwise parse it"""
+    if isinstance(source, HtmlDocument):
+        return source
+    return HtmlDocument(source)
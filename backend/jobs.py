@@ -0,0 +1,267 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# Minimum seconds between two progress snapshots of a job written to a shared directory
+SNAPSHOT_INTERVAL = 0.5
+
+
+class Job:
+    """A queued conversion and its progress, as reported by GET /jobs/<id>"""
+
+    def __init__(self, filename, outputs):
+        self.id = str(uuid.uuid4())
+        self.filename = filename
+        self.outputs = outputs
+        self.status = 'queued'
+        self.stage = None
+        self.boxes_rendered = 0
+        self.boxes_total = None
+        self.error = None
+        self.result_path = None  # Finished workbook, a file kept by the JobStore
+        self.result_size = None
+        self.ticket = None  # Admission ticket while the job waits for a processing slot
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._on_change = None  # Set by a JobStore that shares job state with other processes
+        self._snapshot_at = 0
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def report_progress(self, stage, done=None, total=None):
+        """Progress callback handed to process_html_content"""
+        with self._lock:
+            self.status = 'processing'
+            self.stage = stage
+            if total is not None:
+                self.boxes_total = total
+            if done is not None:
+                self.boxes_rendered = done
+            stage_changed = done is None
+        self._changed(force=stage_changed)
+
+    def complete(self, result_path, result_size):
+        with self._lock:
+            self.result_path = result_path
+            self.result_size = result_size
+            self.status = 'done'
+            self.stage = None
+            self.finished_at = time.time()
+        self._changed(force=True)
+
+    def fail(self, error):
+        with self._lock:
+            self.error = error
+            self.status = 'failed'
+            self.finished_at = time.time()
+        self._changed(force=True)
+
+    def _changed(self, force=False):
+        if self._on_change is None:
+            return
+        now = time.monotonic()
+        if force or now - self._snapshot_at >= SNAPSHOT_INTERVAL:
+            self._snapshot_at = now
+            self._on_change(self)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, result_path=None):
+        """Read-only copy of a job written by another process"""
+        job = cls(snapshot['filename'], tuple(snapshot['outputs']))
+        job.id = snapshot['job_id']
+        job.status = snapshot['status']
+        job.stage = snapshot['stage']
+        job.boxes_rendered = snapshot['progress']['boxes_rendered']
+        job.boxes_total = snapshot['progress']['boxes_total']
+        job.error = snapshot['error']
+        job.created_at = snapshot['created_at']
+        job.finished_at = snapshot['finished_at']
+        job.result_path = result_path
+        job.result_size = snapshot['result_size_bytes']
+        return job
+
+    def to_dict(self):
+        queue_position = self.ticket.position if self.ticket is not None else 0
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'filename': self.filename,
+                'outputs': list(self.outputs),
+                'status': self.status,
+                'queue_position': queue_position,
+                'stage': self.stage,
+                'progress': {
+                    'boxes_rendered': self.boxes_rendered,
+                    'boxes_total': self.boxes_total
+                },
+                'error': self.error,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+                'result_size_bytes': self.result_size
+            }
+
+
+class JobStore:
+    """
+    Thread-safe registry of jobs with TTL-bounded result retention
+
+    Finished workbooks are kept as files, not in memory: in `shared_dir`, or
+    in a private temporary directory without it. Finished jobs (and their
+    workbooks) are dropped `ttl` seconds after they finish; when more than
+    `max_finished` finished jobs are held, the oldest are dropped first.
+
+    With `shared_dir`, every job's state is also written there, so any
+    worker process of a multi-process server can answer status and result
+    requests for jobs run by another worker.
+
+    Args:
+        ttl: Seconds a finished job and its result stay available
+        max_finished: Maximum number of finished jobs kept at once
+        shared_dir: Directory shared by all worker processes, or None
+    """
+
+    def __init__(self, ttl=600, max_finished=100, shared_dir=None):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.shared_dir = shared_dir
+        self.result_dir = shared_dir or tempfile.mkdtemp(prefix='html2excel-results-')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._shared_purged_at = 0
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    def create(self, filename, outputs):
+        job = Job(filename, outputs)
+        if self.shared_dir:
+            job._on_change = self._write_snapshot
+            self._write_snapshot(job)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        return job
+
+    def complete(self, job, output):
+        """Copy a finished workbook (a binary file object) to the job's result file and mark the job done"""
+        fd, temp_path = tempfile.mkstemp(dir=self.result_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(output, f)
+                size = f.tell()
+            path = self._result_path(job.id)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        job.complete(path, size)
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+        if job is None and self.shared_dir:
+            job = self._read_snapshot(job_id)
+        return job
+
+    def pending_count(self):
+        """Jobs that are queued or still processing"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def stats(self):
+        with self._lock:
+            self._purge()
+            finished = sum(1 for job in self._jobs.values() if job.finished)
+            return {
+                'pending': len(self._jobs) - finished,
+                'finished': finished,
+                'result_ttl_seconds': self.ttl
+            }
+
+    def _purge(self):
+        now = time.time()
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished),
+            key=lambda job: job.finished_at
+        )
+        excess = len(finished) - self.max_finished
+        for i, job in enumerate(finished):
+            if i < excess or now - job.finished_at > self.ttl:
+                del self._jobs[job.id]
+                self._remove_files(job.id)
+        if self.shared_dir and now - self._shared_purged_at > self.ttl / 10:
+            self._shared_purged_at = now
+            self._purge_shared(now)
+
+    def _snapshot_path(self, job_id, suffix):
+        # Job ids come from URLs; only canonical UUIDs map to files
+        try:
+            job_id = str(uuid.UUID(job_id))
+        except ValueError:
+            return None
+        return os.path.join(self.shared_dir, f"{job_id}{suffix}")
+
+    def _result_path(self, job_id):
+        return os.path.join(self.result_dir, f"{job_id}.xlsx")
+
+    def _write_snapshot(self, job):
+        snapshot = job.to_dict()
+        snapshot.pop('queue_position', None)
+        try:
+            # complete() writes the workbook before the job is done, so a 'done' snapshot always has its result
+            self._write_file(self._snapshot_path(job.id, '.json'), json.dumps(snapshot).encode('utf-8'))
+        except OSError:
+            # Other processes just keep seeing the previous state; the owning process is unaffected
+            pass
+
+    def _write_file(self, path, data):
+        fd, temp_path = tempfile.mkstemp(dir=self.shared_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _read_snapshot(self, job_id):
+        path = self._snapshot_path(job_id, '.json')
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                snapshot = json.loads(f.read())
+            result_path = None
+            if snapshot['status'] == 'done':
+                result_path = self._snapshot_path(job_id, '.xlsx')
+                if not os.path.exists(result_path):
+                    return None
+        except (OSError, ValueError, KeyError):
+            return None
+        if snapshot['finished_at'] is not None and time.time() - snapshot['finished_at'] > self.ttl:
+            return None
+        return Job.from_snapshot(snapshot, result_path)
+
+    def _remove_files(self, job_id):
+        """Delete a dropped job's workbook and, in a shared directory, its state"""
+        paths = [self._result_path(job_id)]
+        if self.shared_dir:
+            paths.append(self._snapshot_path(job_id, '.json'))
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _purge_shared(self, now):
+        """Drop expired snapshots left by any process, including ones that exited"""
+        for name in os.listdir(self.shared_dir):
+            path = os.path.join(self.shared_dir, name)
+            try:
+                if now - os.stat(path).st_mtime > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
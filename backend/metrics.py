@@ -0,0 +1,276 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the default histogram buckets, from a single box up to a whole conversion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def timed_call(fn, *args, **kwargs):
+    """
+    Call fn(*args, timings=timings, **kwargs) and return (result, timings)
+
+    For functions that fill a `timings` dict while running in a worker
+    process, where a dict passed by the caller would never be updated.
+    """
+    timings = {}
+    return fn(*args, timings=timings, **kwargs), timings
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """{label values: value} of this process"""
+        if self.callback is not None:
+            values = self.callback()
+            if not isinstance(values, dict):
+                return {(): values}
+            return {key if isinstance(key, tuple) else (key,): value for key, value in values.items()}
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    """Monotonic count; `callback` returns the current total (or {label values: total}) instead of inc()"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; `callback` reads it at scrape time instead of set()"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets, plus their sum and count"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts (not cumulative), then sum and count
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Registry:
+    """
+    Metrics of the server, rendered in the Prometheus text exposition format
+
+    With `shared_dir`, every process of a multi-process server writes its
+    values to that directory every `flush_interval` seconds and render()
+    adds up the files of all processes, so whichever worker answers the
+    scrape reports the totals. Counters and histograms of processes that
+    exited (e.g. recycled workers) are kept so totals never go backwards;
+    their gauges are dropped.
+
+    Args:
+        shared_dir: Directory shared by the server processes, or None
+        flush_interval: Seconds between writes of this process's values
+    """
+
+    def __init__(self, shared_dir=None, flush_interval=5):
+        self.shared_dir = shared_dir
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def counter(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def start(self):
+        """Start writing this process's values to the shared directory"""
+        if self.shared_dir is None or self._flusher is not None:
+            return
+        os.makedirs(self.shared_dir, exist_ok=True)
+        self._stopped.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        """Stop the flush thread after a last write"""
+        if self._flusher is None:
+            return
+        self._stopped.set()
+        self._flusher.join()
+        self._flusher = None
+        self.flush()
+
+    def snapshot(self):
+        """This process's values as plain JSON-serializable data"""
+        metrics = {}
+        for name, metric in self._metrics.items():
+            try:
+                values = metric.snapshot()
+            except Exception:
+                # A failing callback must not take the whole scrape down
+                continue
+            metrics[name] = [[list(key), value] for key, value in values.items()]
+        return {'pid': os.getpid(), 'metrics': metrics}
+
+    def flush(self):
+        """Write this process's values to the shared directory (atomically)"""
+        if self.shared_dir is None:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.shared_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, os.path.join(self.shared_dir, f"metrics-{os.getpid()}.json"))
+
+    def render(self):
+        """All metrics in the Prometheus text format, summed over the server processes"""
+        totals = self._merge([self.snapshot()] + self._other_snapshots())
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(totals.get(name, {}).items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.type != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _other_snapshots(self):
+        if self.shared_dir is None:
+            return []
+        snapshots = []
+        try:
+            names = os.listdir(self.shared_dir)
+        except OSError:
+            return []
+        for file_name in names:
+            if not (file_name.startswith('metrics-') and file_name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.shared_dir, file_name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get('pid') == os.getpid():
+                continue
+            if not _process_alive(snapshot.get('pid')):
+                snapshot['metrics'] = {name: values for name, values in snapshot['metrics'].items()
+                                       if name in self._metrics and self._metrics[name].type != 'gauge'}
+            snapshots.append(snapshot)
+        return snapshots
+
+    def _merge(self, snapshots):
+        totals = {}
+        for snapshot in snapshots:
+            for name, values in snapshot['metrics'].items():
+                if name not in self._metrics:
+                    continue
+                merged = totals.setdefault(name, {})
+                for key, value in values:
+                    key = tuple(key)
+                    if isinstance(value, list):
+                        previous = merged.get(key)
+                        merged[key] = value if previous is None else [a + b for a, b in zip(previous, value)]
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+        return totals
+
+
+def _process_alive(pid):
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
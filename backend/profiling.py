@@ -0,0 +1,241 @@
+import cProfile
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+# Functions listed in a profile summary, by cumulative time
+PROFILE_TOP_FUNCTIONS = 40
+SUMMARY_NAME = 'profile.json'
+STATS_NAME = 'profile.pstats'
+
+# cProfile cannot run twice at once in one process on every Python version, so profiles take turns
+_cpu_profile_lock = threading.Lock()
+
+
+class RequestProfile:
+    """
+    Span tree, CPU profile and browser traces of one profiled conversion
+
+    Spans nest per thread: a span opened inside another one on the same
+    thread becomes its child, a span opened on another thread hangs off
+    the root. Everything is written to `directory` by finish():
+    profile.json (span tree and the slowest functions), profile.pstats
+    (for pstats or snakeviz) and the Playwright traces, trace-<n>.zip.
+
+    Args:
+        profile_id: Id the profile is stored and fetched under (a job id)
+        directory: Directory of this profile's files, created if missing
+        started: time.perf_counter() at which the request began; now by default
+    """
+
+    enabled = True
+
+    def __init__(self, profile_id, directory, started=None):
+        self.id = profile_id
+        self.directory = directory
+        self.trace_dir = directory
+        os.makedirs(directory, exist_ok=True)
+        self.created_at = time.time()
+        self.root = {'name': 'request', 'start': 0.0, 'duration': None, 'attributes': {}, 'children': []}
+        self._started = started if started is not None else time.perf_counter()
+        self._profiler = None
+        self._cpu_note = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Record a block as a span; yields its attributes dict, so more can be added while it runs"""
+        stack = self._stack()
+        span = self._add(stack[-1], name, time.perf_counter() - self._started, attributes)
+        stack.append(span)
+        try:
+            yield attributes
+        except BaseException as e:
+            span['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            span['duration'] = round(time.perf_counter() - self._started - span['start'], 6)
+
+    def record_steps(self, timings):
+        """
+        Add the steps of a `timings` dict (e.g. from extract_outputs) as child spans
+
+        The steps ran one after another and just finished, in dict order.
+        """
+        start = time.perf_counter() - self._started - sum(timings.values())
+        parent = self._stack()[-1]
+        for name, seconds in timings.items():
+            span = self._add(parent, name, start, {})
+            span['duration'] = round(seconds, 6)
+            start += seconds
+
+    @contextmanager
+    def cpu_profile(self):
+        """Profile the Python code run by the current thread inside the block"""
+        if not _cpu_profile_lock.acquire(blocking=False):
+            self._cpu_note = 'skipped: another request was being profiled'
+            yield
+            return
+        try:
+            self._profiler = self._profiler or cProfile.Profile()
+            self._profiler.enable()
+            try:
+                yield
+            finally:
+                self._profiler.disable()
+        finally:
+            _cpu_profile_lock.release()
+
+    def finish(self, status='done', error=None):
+        """Close the root span and write the profile's files; returns the summary"""
+        self.root['duration'] = round(time.perf_counter() - self._started, 6)
+        summary = {
+            'profile_id': self.id,
+            'status': status,
+            'error': error,
+            'created_at': self.created_at,
+            'duration_seconds': self.root['duration'],
+            'spans': self.root,
+            'cpu_profile': self._cpu_summary()
+        }
+        if self._profiler is not None:
+            self._profiler.dump_stats(os.path.join(self.directory, STATS_NAME))
+        summary['artifacts'] = sorted(os.listdir(self.directory)) + [SUMMARY_NAME]
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        os.replace(temp_path, os.path.join(self.directory, SUMMARY_NAME))
+        return summary
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = [self.root]
+        return self._local.stack
+
+    def _add(self, parent, name, start, attributes):
+        span = {
+            'name': name,
+            'start': round(start, 6),
+            'duration': None,
+            'thread': threading.current_thread().name,
+            'attributes': attributes,
+            'children': []
+        }
+        with self._lock:
+            parent['children'].append(span)
+        return span
+
+    def _cpu_summary(self):
+        if self._profiler is None:
+            return {'note': self._cpu_note or 'no CPU profile recorded', 'functions': []}
+        stats = pstats.Stats(self._profiler).sort_stats('cumulative')
+        functions = []
+        for function in stats.fcn_list[:PROFILE_TOP_FUNCTIONS]:
+            _, calls, total, cumulative, _ = stats.stats[function]
+            functions.append({
+                'function': pstats.func_std_string(function),
+                'calls': calls,
+                'total_seconds': round(total, 6),
+                'cumulative_seconds': round(cumulative, 6)
+            })
+        return {'note': self._cpu_note, 'functions': functions}
+
+
+class NullProfile:
+    """Stand-in for RequestProfile when a request is not profiled; records nothing"""
+
+    enabled = False
+    trace_dir = None
+
+    def span(self, name, **attributes):
+        return nullcontext({})
+
+    def record_steps(self, timings):
+        pass
+
+    def cpu_profile(self):
+        return nullcontext()
+
+    def finish(self, status='done', error=None):
+        pass
+
+
+NO_PROFILE = NullProfile()
+
+
+class ProfileStore:
+    """
+    Profiles of past requests on disk, keyed by job id
+
+    Only the newest `max_profiles` are kept. With a directory shared by all
+    server processes any of them can serve a profile.
+
+    Args:
+        directory: Where profiles are kept; None creates a temp directory
+        max_profiles: Older profiles are deleted beyond this count
+    """
+
+    def __init__(self, directory=None, max_profiles=20):
+        self.directory = directory or tempfile.mkdtemp(prefix='html2excel-profiles-')
+        self.max_profiles = max_profiles
+        os.makedirs(self.directory, exist_ok=True)
+
+    def create(self, profile_id=None, started=None):
+        """Start a profile under the given id (a new UUID by default), see RequestProfile"""
+        profile_id = profile_id or str(uuid.uuid4())
+        self._prune()
+        return RequestProfile(profile_id, os.path.join(self.directory, profile_id), started)
+
+    def summary(self, profile_id):
+        """
+        The profile's summary dict, {'status': 'running'} while it is being
+        recorded, or None for unknown ids
+        """
+        directory = self._profile_dir(profile_id)
+        if directory is None or not os.path.isdir(directory):
+            return None
+        try:
+            with open(os.path.join(directory, SUMMARY_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'profile_id': profile_id, 'status': 'running'}
+
+    def artifact_path(self, profile_id, name):
+        """Path of one of a finished profile's files, or None"""
+        summary = self.summary(profile_id)
+        if summary is None or name not in summary.get('artifacts', ()):
+            return None
+        return os.path.join(self._profile_dir(profile_id), name)
+
+    def _profile_dir(self, profile_id):
+        # Profile ids come from URLs; only canonical UUIDs map to directories
+        try:
+            profile_id = str(uuid.UUID(profile_id))
+        except ValueError:
+            return None
+        return os.path.join(self.directory, profile_id)
+
+    def _prune(self):
+        try:
+            entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        except OSError:
+            return
+        directories = []
+        for path in entries:
+            try:
+                if os.path.isdir(path):
+                    directories.append((os.path.getmtime(path), path))
+            except OSError:
+                # Removed by another process meanwhile
+                continue
+        directories.sort()
+        for _, path in directories[:max(0, len(directories) - self.max_profiles + 1)]:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Content-addressed cache of generated bytes (workbooks, section screenshots)
+
+    Entries are keyed by a hash of the input plus every option that changes
+    the output, so re-uploads of the same report are served without parsing
+    or rendering. The in-memory tier is an LRU bounded by total size; the
+    optional disk tier survives restarts and is bounded the same way.
+
+    Args:
+        max_bytes: Memory budget for cached entries
+        disk_dir: Directory for the on-disk tier, or None to disable it
+        disk_max_bytes: Disk budget for the on-disk tier
+        suffix: File extension of entries in the on-disk tier
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=2 * 1024 * 1024 * 1024,
+                 suffix='.xlsx'):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.suffix = suffix
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> size, least recently used first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(content_hash, **options):
+        """Cache key for a content hash (e.g. of the uploaded bytes) and its processing options"""
+        payload = json.dumps(options, sort_keys=True, default=str)
+        return hashlib.sha256(f"{content_hash}:{payload}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Cached bytes, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return data
+            on_disk = key in self._disk
+
+        if on_disk:
+            data = self._read_disk(key)
+            if data is not None:
+                with self._lock:
+                    self._hits += 1
+                    self._disk_hits += 1
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self._store_memory(key, data)
+                return data
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key, data):
+        """Store bytes in memory and, when enabled, on disk"""
+        with self._lock:
+            self._store_memory(key, data)
+            write_disk = self.disk_dir and key not in self._disk and len(data) <= self.disk_max_bytes
+        if write_disk:
+            self._write_disk(key, data)
+
+    def put_file(self, key, stream):
+        """
+        Store the contents of a binary file object, e.g. a spooled workbook
+
+        With the disk tier the file is copied there in chunks and never read
+        into memory; the memory tier picks the entry up on its first hit.
+        Without it the bytes are kept in memory if they fit. The stream is
+        left at its end.
+        """
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        if not self.disk_dir:
+            if size <= self.max_bytes:
+                self.put(key, stream.read())
+            return
+        with self._lock:
+            write_disk = key not in self._disk and size <= self.disk_max_bytes
+        if write_disk:
+            self._write_disk(key, stream)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'hit_rate_percentage': round(self._hits / lookups * 100, 1) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes
+            }
+
+    def _store_memory(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}{self.suffix}")
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.disk_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            with self._lock:
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            return None
+
+    def _write_disk(self, key, data):
+        """Write bytes, or the rest of a binary file object, as the key's disk entry"""
+        try:
+            # Write to a temporary file first so readers never see a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+                size = f.tell()
+            os.replace(temp_path, self._disk_path(key))
+        except OSError:
+            return
+        finally:
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+        evicted = []
+        with self._lock:
+            # A concurrent put of the same key may have counted it already
+            previous = self._disk.pop(key, None)
+            if previous is not None:
+                self._disk_bytes -= previous
+            self._disk[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
@@ -1,163 +1,723 @@
-from bs4 import BeautifulSoup
+from bs4.element import NavigableString, PreformattedString, Tag
 from playwright.sync_api import sync_playwright
 import openpyxl
-from PIL import Image as PILImage
 from openpyxl.drawing.image import Image as ExcelImage
+from openpyxl.styles import Font
+from PIL import Image as PILImage
+import asyncio
+import hashlib
+import io
 import os
+import re
+import struct
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from cancellation import check_cancelled
+from html_analysis import as_html_document
+from result_cache import ResultCache
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# URL schemes that never leave the browser and are always allowed
+INLINE_URL_SCHEMES = ('data', 'blob', 'about')
+
+# Sections start at this heading and are extracted when they contain the marker text
+SECTION_HEADING_TAG = 'h4'
+SECTION_MARKER_TEXT = 'Uncovered Link'
+
+# Elements whose text BeautifulSoup's get_text() leaves out; it is never extracted and never carries the marker
+HIDDEN_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+# Excel's limit on sheet title length and the characters a title may not contain
+SHEET_TITLE_MAX_LENGTH = 31
+INVALID_SHEET_TITLE_PATTERN = re.compile(r'[\[\]:*?/\\]')
+
+# Sheets a conversion can produce (the 'outputs' option of the server and the CLI), and the default choice
+OUTPUT_SHEETS = ('images', 'tables', 'text', 'meta')
+DEFAULT_OUTPUTS = ('images',)
+
+# Larger reports are parsed incrementally instead of into a full tree, which only supports these outputs
+STREAMING_THRESHOLD = 10 * 1024 * 1024
+STREAMING_OUTPUTS = ('images', 'tables')
+
+# Batch workbook layouts: a sheet per report, or every report on one sheet under its own header row
+BATCH_LAYOUTS = ('sheets', 'combined')
+
+# Sharded rendering never splits a job into pages with fewer boxes than this
+MIN_BOXES_PER_SHARD = 20
 
+# Tallest region captured by one screenshot in batch capture mode (CSS pixels)
+MAX_TILE_HEIGHT = 4096
 
-def convert_html_to_excel(html_file_path, excel_output_path="output.xlsx", class_selector=".box"):
+# Page-coordinate bounding boxes of every element matching a selector
+BOUNDING_BOXES_SCRIPT = """
+selector => Array.from(document.querySelectorAll(selector), element => {
+    const rect = element.getBoundingClientRect();
+    return {x: rect.left + window.scrollX, y: rect.top + window.scrollY, width: rect.width, height: rect.height};
+})
+"""
+
+# Markup whose whitespace is rendered as-is and must not be collapsed for the section cache key
+PRESERVED_WHITESPACE_PATTERN = re.compile(r'<(?:pre|textarea)\b|white-space', re.IGNORECASE)
+WHITESPACE_RUN_PATTERN = re.compile(r'\s+')
+
+# Markup that makes the browser fetch something before the load event
+SUBRESOURCE_PATTERN = re.compile(r'<(?:img|link|iframe|object|embed|video|audio|source|script)\b|url\(|@import',
+                                 re.IGNORECASE)
+
+
+def capture_sections_images(sections, browser_pool=None, shards=1, render_slots=None, allowed_hosts=(),
+                            capture_mode="element", box_class="image-box", min_boxes_per_shard=MIN_BOXES_PER_SHARD,
+                            progress=None, image_cache=None, cache_options=None, cancel=None, on_box=None,
+                            trace_dir=None):
     """
-    Convert HTML file to Excel with original-sized floating images of box elements
+    Render extracted sections and screenshot them, optionally sharded across pages
+    
+    With a browser pool the sections are split into up to `shards`
+    contiguous chunks, each rendered in its own page on a pooled browser
+    concurrently, and the images are reassembled in the original order.
+    
+    With an image cache, sections whose normalized markup was rendered
+    before under the same options are taken from the cache and only the
+    new or changed sections are sent to the browser.
     
     Args:
-        html_file_path: Path to your HTML file
-        excel_output_path: Output Excel file path
+        sections: List of section markup, e.g. from extract_marked_sections
+        shards: Maximum number of pages used for this job
+        render_slots: Optional semaphore shared by all jobs; one slot is held
+            per shard while it renders, bounding concurrent renders globally
+        min_boxes_per_shard: Do not split below this many boxes per page
+        progress: Optional callable(rendered, total) called after every box
+        image_cache: Optional ResultCache of section screenshots (PNG bytes)
+        cache_options: Every other setting that changes a screenshot
+            (viewport, stylesheet, ...), mixed into each section's cache key
+        cancel: Optional CancelToken; every shard stops at its next box once
+            it is cancelled and pending shards never start
+        on_box: Optional callable(seconds) called with the capture time of
+            every box rendered in a browser (cached sections are not timed)
+        trace_dir: Optional directory receiving a Playwright trace of every
+            page, trace-<n>.zip (open with `playwright show-trace`)
+    
+    Returns:
+        List of dicts as returned by capture_box_images, in section order
+    """
+    if not sections:
+        print("🔍 No sections to render")
+        return []
+    
+    rendered = [0]
+    rendered_lock = threading.Lock()
+    
+    def report_image(seconds=None):
+        if on_box is not None and seconds is not None:
+            on_box(seconds)
+        if progress is None:
+            return
+        with rendered_lock:
+            rendered[0] += 1
+            done = rendered[0]
+        progress(done, len(sections))
+    
+    on_image = report_image if progress is not None or on_box is not None else None
+    
+    render = lambda pending, keep_empty=False: _render_sections(pending, browser_pool, shards, render_slots,
+                                                                allowed_hosts, capture_mode, box_class,
+                                                                min_boxes_per_shard, on_image, cancel, trace_dir,
+                                                                keep_empty)
+    if image_cache is None:
+        return render(sections)
+    
+    options = dict(cache_options or {}, box_class=box_class, capture_mode=capture_mode,
+                   allowed_hosts=sorted(allowed_hosts))
+    keys = [section_cache_key(section, **options) for section in sections]
+    images = []
+    missing = []
+    for index, key in enumerate(keys):
+        png = image_cache.get(key)
+        if png is None:
+            images.append(None)
+            missing.append(index)
+            continue
+        width, height = png_dimensions(png)
+        images.append({'png': png, 'width': width, 'height': height})
+        if on_image is not None:
+            on_image()
+    print(f"🗂️ {len(sections) - len(missing)} of {len(sections)} sections served from the screenshot cache")
+    
+    if not missing:
+        return images
+    
+    # Zero-sized boxes stay as None, so every captured image lines up with its section
+    captured = render([sections[index] for index in missing], keep_empty=True)
+    if len(captured) != len(missing):
+        # A section holds further boxes of its own; the images cannot be matched to sections
+        print(f"⚠️ Expected {len(missing)} boxes but captured {len(captured)}, re-rendering without the cache")
+        rendered[0] = 0
+        return render(sections)
+    
+    for index, image in zip(missing, captured):
+        images[index] = image
+        if image is not None:
+            image_cache.put(keys[index], image['png'])
+    # Zero-sized sections are left out, as without the cache
+    return [image for image in images if image is not None]
+
+
+def section_cache_key(section_html, **options):
+    """Cache key of one section's screenshot, insensitive to insignificant whitespace"""
+    if not PRESERVED_WHITESPACE_PATTERN.search(section_html):
+        section_html = WHITESPACE_RUN_PATTERN.sub(' ', section_html).strip()
+    content_hash = hashlib.sha256(section_html.encode('utf-8')).hexdigest()
+    return ResultCache.make_key(content_hash, **options)
+
+
+def _render_sections(sections, browser_pool, shards, render_slots, allowed_hosts, capture_mode, box_class,
+                     min_boxes_per_shard, on_image, cancel=None, trace_dir=None, keep_empty=False):
+    """
+    Screenshot the given sections, in one one-off browser or sharded across pooled pages
+    
+    With keep_empty, zero-sized boxes leave a None in the result (see capture_box_images).
     """
+    class_selector = f".{box_class}"
+    
+    def capture_job(shard, html_document):
+        # (job, args) for a context of the pool, traced when a trace directory is given
+        args = (class_selector, allowed_hosts, html_document, capture_mode, on_image, cancel, keep_empty)
+        if trace_dir is None:
+            return _context_capture(browser_pool), args
+        return _context_capture(browser_pool, traced=True), (os.path.join(trace_dir, f"trace-{shard}.zip"),) + args
+    
+    if browser_pool is None:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            try:
+                job, args = capture_job(1, wrap_sections_html(sections, box_class))
+                return job(browser.new_context(), *args)
+            finally:
+                browser.close()
     
+    shard_count = max(1, min(shards, -(-len(sections) // min_boxes_per_shard)))
+    shard_size = -(-len(sections) // shard_count)
+    print(f"🧩 Rendering {len(sections)} sections in {shard_count} page(s)")
+    
+    futures = []
     try:
+        for start in range(0, len(sections), shard_size):
+            check_cancelled(cancel)
+            html_document = wrap_sections_html(sections[start:start + shard_size], box_class)
+            if render_slots is not None:
+                render_slots.acquire()
+            try:
+                job, args = capture_job(len(futures) + 1, html_document)
+                future = browser_pool.submit(job, *args)
+            except BaseException:
+                if render_slots is not None:
+                    render_slots.release()
+                raise
+            if render_slots is not None:
+                future.add_done_callback(lambda _: render_slots.release())
+            futures.append(future)
         
-        with sync_playwright() as p:
-            # Launch browser
-            browser = p.chromium.launch(headless=False)
-            page = browser.new_page()
-            
-            # Open the HTML on browser
-            print(f"📂 Opening HTML file: {html_file_path}")
-            page.goto(f"file://{html_file_path}")
-            
-            # Wait for the box elements to load
-            page.wait_for_selector(class_selector)
-            
-            # Find all box elements
-            box_elements = page.query_selector_all(class_selector)
-            print(f"🔍 Found {len(box_elements)} box elements")
-            
-            # Create Excel workbook
-            workbook = openpyxl.Workbook()
-            worksheet = workbook.active
-            worksheet.title = "HTML Box Images"
-            
-            # Starting position for floating images
-            current_row = 1
-            vertical_offset = 0  # Track vertical position for floating images
-            
-            # Process each box element
-            for i, box_element in enumerate(box_elements):
-                print(f"📸 Taking screenshot of box {i+1}")
-                
-                # Screenshot filename
-                screenshot_path = f"temp_box_{i+1}.png"
-                
-                # Take screenshot of the box element
-                box_element.screenshot(path=screenshot_path)
-                
-                # Add floating image to Excel
-                if os.path.exists(screenshot_path):
-                    # Get original image dimensions
-                    with PILImage.open(screenshot_path) as pil_img:
-                        original_width, original_height = pil_img.size
-                    
-                    img = ExcelImage(screenshot_path)
-                    
-                    # Keep original image size (no resizing)
-                    img.width = original_width
-                    img.height = original_height
-                    
-                    # Set image anchor to cell position (images will maintain original size)
-                    img.anchor = f'A{current_row}'
-                    
-                    # Add image to worksheet
-                    worksheet.add_image(img)
-                    
-                    # Calculate rows needed for this image (based on approximate row height)
-                    approx_row_height_pixels = 20  # Default Excel row height in pixels
-                    rows_needed = max(1, (original_height + 10) // approx_row_height_pixels)
-                    current_row += rows_needed + 1  # Add extra row for spacing
-                    
-                    print(f"✅ Added floating image {i+1} to Excel (Size: {original_width}x{original_height})")
-            
-            # Set column width to be reasonable (images will float over it)
-            worksheet.column_dimensions['A'].width = 20
-            
-            # Add some empty rows to ensure all images are visible
-            for row in range(current_row, current_row + 5):
-                worksheet.cell(row=row, column=1, value="")
-            
-            # Save Excel file
-            workbook.save(excel_output_path)
-            print(f"💾 Excel file saved: {excel_output_path}")
-            
-            # Close browser
-            browser.close()
-            
-            # Clean up temporary image files
-            for i in range(len(box_elements)):
-                temp_file = f"temp_box_{i+1}.png"
-                try:
-                    os.remove(temp_file)
-                    print(f"🧹 Cleaned up: {temp_file}")
-                except:
-                    pass
-            
-            print(f"🎉 Process completed successfully!")
-            print(f"📋 Images are floating and maintain their original dimensions")
-            return excel_output_path
-            
-    except FileNotFoundError:
-        print(f"❌ Error: HTML file not found at {html_file_path}")
-        return None
-    except Exception as e:
-        print(f"❌ Error occurred: {e}")
-        return None
+        images = []
+        for future in futures:
+            images.extend(future.result())
+        return images
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def _context_capture(browser_pool, traced=False):
+    """The capture job matching a pool: coroutine for an AsyncRenderEngine, plain function for a BrowserPool"""
+    if getattr(browser_pool, 'asynchronous', False):
+        return _capture_traced_async if traced else _capture_in_context_async
+    return _capture_traced if traced else _capture_in_context
+
+
+def _capture_in_context(context, class_selector, allowed_hosts=(), html_document="", capture_mode="element",
+                        on_image=None, cancel=None, keep_empty=False):
+    """Render the HTML document in the given browser context and screenshot its box elements"""
+    check_cancelled(cancel)
+    page = context.new_page()
+    if cancel is not None and cancel.remaining() is not None:
+        # Navigation and screenshots give up when the conversion's deadline passes
+        page.set_default_timeout(max(1, cancel.remaining() * 1000))
     
+    # Only the allowlisted hosts are reachable, so load time no longer depends on remote resources
+    block_external_requests(page, allowed_hosts)
+    page.set_content(html_document, wait_until=document_wait_until(html_document))
+    
+    return capture_box_images(page, class_selector, capture_mode, on_image, cancel, keep_empty)
 
 
-def extract_html_content(extracted_html_file_path: str,html_content: str):
-    """Parse HTML content and find 'Uncovered Link' text between h4 elements"""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    found_results = []
+async def _capture_in_context_async(context, class_selector, allowed_hosts=(), html_document="",
+                                    capture_mode="element", on_image=None, cancel=None, keep_empty=False):
+    """_capture_in_context for a browser context of Playwright's async API (see AsyncRenderEngine)"""
+    check_cancelled(cancel)
+    page = await context.new_page()
+    if cancel is not None and cancel.remaining() is not None:
+        page.set_default_timeout(max(1, cancel.remaining() * 1000))
     
-    extract_uncovered_link_boxes=''
+    await block_external_requests_async(page, allowed_hosts)
+    await page.set_content(html_document, wait_until=document_wait_until(html_document))
+    
+    return await capture_box_images_async(page, class_selector, capture_mode, on_image, cancel, keep_empty)
+
+
+def _capture_traced(context, trace_path, *args):
+    """_capture_in_context, recording a Playwright trace (screenshots and DOM snapshots) to trace_path"""
+    context.tracing.start(screenshots=True, snapshots=True)
+    try:
+        return _capture_in_context(context, *args)
+    finally:
+        context.tracing.stop(path=trace_path)
+
+
+async def _capture_traced_async(context, trace_path, *args):
+    """_capture_traced for a browser context of Playwright's async API"""
+    await context.tracing.start(screenshots=True, snapshots=True)
+    try:
+        return await _capture_in_context_async(context, *args)
+    finally:
+        await context.tracing.stop(path=trace_path)
+
+
+def block_external_requests(page, allowed_hosts=()):
+    """
+    Abort every request the page makes except inline (data:/blob:) URLs
+    and requests to the allowlisted hosts
+    """
+    is_allowed = _request_filter(allowed_hosts)
+
+    def handle_route(route):
+        if is_allowed(route.request.url):
+            route.continue_()
+        else:
+            route.abort()
+
+    page.route("**/*", handle_route)
+
+
+async def block_external_requests_async(page, allowed_hosts=()):
+    """block_external_requests for a page of Playwright's async API"""
+    is_allowed = _request_filter(allowed_hosts)
 
-    # Find all h4 elements
-    h4_elements = soup.find_all('h4')
+    async def handle_route(route):
+        if is_allowed(route.request.url):
+            await route.continue_()
+        else:
+            await route.abort()
+
+    await page.route("**/*", handle_route)
+
+
+def _request_filter(allowed_hosts):
+    """Predicate telling whether a page may fetch a URL"""
+    allowed_hosts = {host.lower() for host in allowed_hosts}
+
+    def is_allowed(url):
+        parsed = urlsplit(url)
+        return parsed.scheme in INLINE_URL_SCHEMES or (parsed.hostname or '').lower() in allowed_hosts
+
+    return is_allowed
+
+
+def document_wait_until(html_document):
+    """
+    Pick the cheapest set_content wait state that still renders the document:
+    markup without sub-resources is ready once the DOM is parsed, anything
+    referencing images, stylesheets or fonts needs the load event
+    """
+    if SUBRESOURCE_PATTERN.search(html_document):
+        return 'load'
+    return 'domcontentloaded'
+
+
+def capture_box_images(page, class_selector, capture_mode="element", on_image=None, cancel=None, keep_empty=False):
+    """
+    Screenshot every element matching class_selector straight into memory
     
-    for h4 in h4_elements:
+    Args:
+        capture_mode: 'element' takes one screenshot per element, 'batch'
+            crops all of them out of a few full-page tiles
+        on_image: Optional callable(seconds) invoked after every captured
+            image with the time spent capturing it
+        cancel: Optional CancelToken checked before every screenshot
+        keep_empty: Keep a None in place of every zero-sized box that batch
+            mode skips, so the result lines up with the matching elements
+    
+    Returns:
+        List of dicts with the PNG bytes and its pixel width and height
+    """
+    if capture_mode == "batch":
+        return capture_box_images_batched(page, class_selector, on_image=on_image, cancel=cancel,
+                                          keep_empty=keep_empty)
+    if capture_mode != "element":
+        raise ValueError(f"Unknown capture mode: {capture_mode}")
+    
+    # Find all box elements
+    box_elements = page.query_selector_all(class_selector)
+    print(f"🔍 Found {len(box_elements)} box elements")
+    
+    images = []
+    for i, box_element in enumerate(box_elements):
+        check_cancelled(cancel)
+        print(f"📸 Taking screenshot of box {i+1}")
         
-        # Find all p tags that come after this h4 until the next h4
-        current_element = h4
+        # Take screenshot of the box element (no file is written)
+        started = time.perf_counter()
+        png_bytes = box_element.screenshot()
+        width, height = png_dimensions(png_bytes)
+        images.append({'png': png_bytes, 'width': width, 'height': height})
+        if on_image is not None:
+            on_image(time.perf_counter() - started)
+    
+    return images
 
-        # Initialize variables
-        collected_text = ''
-        found_status = False
+
+def capture_box_images_batched(page, class_selector, max_tile_height=MAX_TILE_HEIGHT, on_image=None, cancel=None,
+                               keep_empty=False):
+    """
+    Screenshot all matching elements with a handful of full-page captures
+    
+    The bounding boxes of every element are read with one evaluate call,
+    neighbouring boxes are grouped into tiles of at most max_tile_height
+    CSS pixels, each tile is captured once and the boxes are cropped out
+    locally with Pillow.
+    """
+    boxes = page.evaluate(BOUNDING_BOXES_SCRIPT, class_selector)
+    print(f"🔍 Found {len(boxes)} box elements")
+    
+    images = [None] * len(boxes)
+    for tile in _group_into_tiles(boxes, max_tile_height):
+        check_cancelled(cancel)
+        clip = _tile_clip(boxes, tile)
         
-        while current_element:
-            
-            # Check for 'Uncovered Link' in child
-            if 'Uncovered Link' in current_element.get_text(strip=True):
-                found_status = True
-            
-            # Collect text
-            collected_text = collected_text + str(current_element)
-            
-            # If we hit the end of the document, stop
-            if current_element.next_sibling is None and found_status == True:
-                extract_uncovered_link_boxes =  extract_uncovered_link_boxes + '<div class="image-box">' + collected_text + '</div>' + '\n'
-                break
-            elif current_element.next_sibling is None and found_status == False:
-                break
-
-            # If we hit another h4, stop searching and collect text
-            if current_element.next_sibling.name == 'h4' and found_status == True:
-                extract_uncovered_link_boxes =  extract_uncovered_link_boxes + '<div class="image-box">' + collected_text + '</div>' + '\n'
-                break
-            # If we hit another h4, stop searching
-            elif current_element.next_sibling.name == 'h4' and found_status == False:
-                break
-            else: 
-                # Move to the next element
-                current_element = current_element.next_sibling
+        print(f"📸 Taking one screenshot for boxes {tile[0]+1}-{tile[-1]+1}")
+        started = time.perf_counter()
+        tile_png = page.screenshot(full_page=True, clip=clip)
+        _crop_tile(tile_png, clip, boxes, tile, images, on_image, time.perf_counter() - started)
+    
+    # Zero-sized boxes are skipped, just like nothing would be visible in their screenshot
+    return images if keep_empty else [image for image in images if image is not None]
+
+
+async def capture_box_images_async(page, class_selector, capture_mode="element", on_image=None, cancel=None,
+                                   keep_empty=False):
+    """
+    capture_box_images for a page of Playwright's async API
+    
+    Cropping and PNG encoding run in a worker thread so they do not stall
+    the other pages sharing the event loop.
+    """
+    if capture_mode == "element":
+        box_elements = await page.query_selector_all(class_selector)
+        print(f"🔍 Found {len(box_elements)} box elements")
+        images = []
+        for box_element in box_elements:
+            check_cancelled(cancel)
+            started = time.perf_counter()
+            png_bytes = await box_element.screenshot()
+            width, height = png_dimensions(png_bytes)
+            images.append({'png': png_bytes, 'width': width, 'height': height})
+            if on_image is not None:
+                on_image(time.perf_counter() - started)
+        return images
+    if capture_mode != "batch":
+        raise ValueError(f"Unknown capture mode: {capture_mode}")
+    
+    boxes = await page.evaluate(BOUNDING_BOXES_SCRIPT, class_selector)
+    print(f"🔍 Found {len(boxes)} box elements")
+    
+    images = [None] * len(boxes)
+    for tile in _group_into_tiles(boxes, MAX_TILE_HEIGHT):
+        check_cancelled(cancel)
+        clip = _tile_clip(boxes, tile)
+        started = time.perf_counter()
+        tile_png = await page.screenshot(full_page=True, clip=clip)
+        await asyncio.to_thread(_crop_tile, tile_png, clip, boxes, tile, images, on_image,
+                                time.perf_counter() - started)
+    
+    return images if keep_empty else [image for image in images if image is not None]
+
+
+def _tile_clip(boxes, tile):
+    """Page region covering every box of a tile"""
+    left = min(boxes[i]['x'] for i in tile)
+    right = max(boxes[i]['x'] + boxes[i]['width'] for i in tile)
+    top = min(boxes[i]['y'] for i in tile)
+    bottom = max(boxes[i]['y'] + boxes[i]['height'] for i in tile)
+    return {'x': left, 'y': top, 'width': right - left, 'height': bottom - top}
+
+
+def _crop_tile(tile_png, clip, boxes, tile, images, on_image=None, tile_seconds=0.0):
+    """
+    Crop the boxes of a tile out of its screenshot into images[i]
+    
+    Each box is timed as its share of the tile screenshot plus its own crop.
+    """
+    with PILImage.open(io.BytesIO(tile_png)) as tile_image:
+        # Device pixels per CSS pixel, in case the context uses a device scale factor
+        scale = tile_image.width / clip['width']
+        for i in tile:
+            started = time.perf_counter()
+            box = boxes[i]
+            crop = tile_image.crop((
+                round((box['x'] - clip['x']) * scale),
+                round((box['y'] - clip['y']) * scale),
+                round((box['x'] - clip['x'] + box['width']) * scale),
+                round((box['y'] - clip['y'] + box['height']) * scale)
+            ))
+            buffer = io.BytesIO()
+            # Favour encode speed; the images are re-compressed inside the xlsx zip anyway
+            crop.save(buffer, format='PNG', compress_level=1)
+            images[i] = {'png': buffer.getvalue(), 'width': crop.width, 'height': crop.height}
+            if on_image is not None:
+                on_image(tile_seconds / len(tile) + time.perf_counter() - started)
+
+
+def _group_into_tiles(boxes, max_tile_height):
+    """Group box indexes, top to bottom, into runs spanning at most max_tile_height"""
+    tiles = []
+    tile = []
+    tile_top = None
+    for i in sorted(range(len(boxes)), key=lambda i: boxes[i]['y']):
+        box = boxes[i]
+        if box['width'] <= 0 or box['height'] <= 0:
+            continue
+        if tile and box['y'] + box['height'] - tile_top > max_tile_height:
+            tiles.append(tile)
+            tile = []
+        if not tile:
+            tile_top = box['y']
+        tile.append(i)
+    if tile:
+        tiles.append(tile)
+    return tiles
+
+
+def parse_outputs(raw_outputs):
+    """Turn a comma-separated 'outputs' value into a tuple of sheet names; raises ValueError for unknown ones"""
+    if not raw_outputs:
+        return DEFAULT_OUTPUTS
+    outputs = tuple(dict.fromkeys(name.strip().lower() for name in raw_outputs.split(',') if name.strip()))
+    unknown = [name for name in outputs if name not in OUTPUT_SHEETS]
+    if unknown or not outputs:
+        raise ValueError(f"Unknown outputs {unknown}; choose from {', '.join(OUTPUT_SHEETS)}")
+    return outputs
+
+
+def build_workbook(excel_output_path, images=None, data_sheets=(), cancel=None, timings=None):
+    """
+    Write the requested sheets into a new workbook
+    
+    Args:
+        excel_output_path: Output Excel file path or writable binary stream
+        images: List of dicts as returned by capture_box_images; the image
+            sheet is left out when None
+        data_sheets: (title, header, rows) tuples written as plain sheets;
+            header may be None
+        cancel: Optional CancelToken checked before every sheet and the save
+        timings: Optional dict that receives the seconds spent filling the
+            sheets ('workbook_build') and writing the file ('save')
+    """
+    started = time.perf_counter()
+    # Create Excel workbook
+    workbook = openpyxl.Workbook()
+    default_sheet = workbook.active
+    
+    if images is not None:
+        add_image_sheet(workbook.create_sheet("HTML Box Images"), images)
+    
+    for title, header, rows in data_sheets:
+        check_cancelled(cancel)
+        add_rows_sheet(workbook.create_sheet(title), header, rows)
+    
+    # A workbook needs at least one sheet, so only drop the default one when something replaced it
+    if len(workbook.sheetnames) > 1:
+        workbook.remove(default_sheet)
+    
+    # Save Excel file (a path or a stream such as the response buffer)
+    check_cancelled(cancel)
+    _save_workbook(workbook, excel_output_path, started, timings)
+    return excel_output_path
+
+
+def build_batch_workbook(excel_output_path, reports, layout='sheets', cancel=None, timings=None):
+    """
+    Write several converted reports into one workbook
+    
+    Each report's images come first, followed by its data sheets as titled
+    blocks of rows.
+    
+    Args:
+        excel_output_path: Output Excel file path or writable binary stream
+        reports: Dicts with the report 'name', 'images' (as for
+            build_workbook, or None) and 'data_sheets'
+        layout: 'sheets' for one sheet per report, 'combined' for a single
+            sheet with a header row above each report
+        cancel: Optional CancelToken checked before every report and the save
+        timings: Optional dict, filled like build_workbook's
+    """
+    if layout not in BATCH_LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}; choose from {', '.join(BATCH_LAYOUTS)}")
+    
+    started = time.perf_counter()
+    workbook = openpyxl.Workbook()
+    combined = workbook.active
+    combined.title = "Reports"
+    taken = set()
+    
+    for report in reports:
+        check_cancelled(cancel)
+        if layout == 'combined':
+            worksheet = combined
+            worksheet.append([report['name']])
+            worksheet.cell(row=worksheet.max_row, column=1).font = Font(bold=True, size=14)
+        else:
+            worksheet = workbook.create_sheet(sheet_title(report['name'], taken))
+        add_report_rows(worksheet, report)
+        if layout == 'combined':
+            worksheet.append([])
+    
+    if layout == 'sheets' and len(workbook.sheetnames) > 1:
+        workbook.remove(combined)
+    
+    check_cancelled(cancel)
+    _save_workbook(workbook, excel_output_path, started, timings)
+    return excel_output_path
+
+
+def _save_workbook(workbook, excel_output_path, started, timings=None):
+    """Write a filled workbook, recording the build and save times in `timings`"""
+    saving = time.perf_counter()
+    workbook.save(excel_output_path)
+    if isinstance(excel_output_path, str):
+        print(f"💾 Excel file saved: {excel_output_path}")
+    if timings is not None:
+        timings['workbook_build'] = saving - started
+        timings['save'] = time.perf_counter() - saving
+
+
+def add_report_rows(worksheet, report):
+    """Write one report's images and data sheets below the worksheet's current content"""
+    if report['images']:
+        add_image_sheet(worksheet, report['images'], start_row=worksheet.max_row + 1)
+    for title, header, rows in report['data_sheets']:
+        worksheet.append([title])
+        worksheet.cell(row=worksheet.max_row, column=1).font = Font(bold=True)
+        add_rows_sheet(worksheet, header, rows)
+        worksheet.append([])
+
+
+def sheet_title(name, taken):
+    """A valid, unique (case-insensitively) sheet title for `name`; records it in `taken`"""
+    base = INVALID_SHEET_TITLE_PATTERN.sub('_', name).strip("' ") or "Report"
+    title = base[:SHEET_TITLE_MAX_LENGTH]
+    counter = 2
+    while title.lower() in taken:
+        suffix = f" ({counter})"
+        title = base[:SHEET_TITLE_MAX_LENGTH - len(suffix)] + suffix
+        counter += 1
+    taken.add(title.lower())
+    return title
+
+
+def add_image_sheet(worksheet, images, start_row=1):
+    """Place the box images as original-sized floating images, one below the other"""
+    # Starting position for floating images
+    current_row = start_row
+    
+    for i, image in enumerate(images):
+        original_width, original_height = image['width'], image['height']
+        
+        # Embed straight from the PNG buffer
+        img = ExcelImage(io.BytesIO(image['png']))
+        
+        # Keep original image size (no resizing)
+        img.width = original_width
+        img.height = original_height
+        
+        # Set image anchor to cell position (images will maintain original size)
+        img.anchor = f'A{current_row}'
+        
+        # Add image to worksheet
+        worksheet.add_image(img)
+        
+        # Calculate rows needed for this image (based on approximate row height)
+        approx_row_height_pixels = 20  # Default Excel row height in pixels
+        rows_needed = max(1, (original_height + 10) // approx_row_height_pixels)
+        current_row += rows_needed + 1  # Add extra row for spacing
+        
+        print(f"✅ Added floating image {i+1} to Excel (Size: {original_width}x{original_height})")
+    
+    # Set column width to be reasonable (images will float over it)
+    worksheet.column_dimensions['A'].width = 20
+    
+    # Add some empty rows to ensure all images are visible
+    for row in range(current_row, current_row + 5):
+        worksheet.cell(row=row, column=1, value="")
+
+
+def add_rows_sheet(worksheet, header, rows):
+    """Write an optional header row followed by the data rows"""
+    if header:
+        worksheet.append(list(header))
+    for row in rows:
+        worksheet.append(list(row))
+
+
+def png_dimensions(png_bytes):
+    """Read (width, height) from the PNG IHDR chunk without decoding the image"""
+    if len(png_bytes) < 24 or png_bytes[:8] != PNG_SIGNATURE or png_bytes[12:16] != b'IHDR':
+        raise ValueError("Screenshot is not a valid PNG image")
+    return struct.unpack('>II', png_bytes[16:24])
+
+
+def extract_html_content(extracted_html_file_path: str,html_content: str):
+    """Parse HTML content and write the 'Uncovered Link' sections to a file"""
+    found_results = []
+
+    # Write the HTML content to a file
+    with open(extracted_html_file_path, "w", encoding="utf-8") as f:
+        f.write(build_extracted_html(html_content))
+
+    return found_results
+
+
+def build_extracted_html(html_content, heading_tag=SECTION_HEADING_TAG, marker_text=SECTION_MARKER_TEXT,
+                         box_class="image-box"):
+    """
+    Find 'Uncovered Link' text between h4 elements
+    
+    Args:
+        html_content: HTML markup or an already parsed HtmlDocument
+        heading_tag: Tag that starts a new section
+        marker_text: Sections containing this text are extracted
+        box_class: Class of the div wrapped around every extracted section
+    """
+    document = as_html_document(html_content)
+    return wrap_sections_html(extract_marked_sections(document, heading_tag, marker_text), box_class)
+
+
+def wrap_sections_html(sections, box_class="image-box"):
+    """
+    Wrap each section's markup in a box div inside a standalone HTML document
+    
+    Args:
+        sections: Iterable of section markup, e.g. from extract_marked_sections
+            or streaming_extraction.iter_marked_sections
+        box_class: Class of the div wrapped around every section
+    """
+    extract_uncovered_link_boxes = ''.join(
+        f'<div class="{box_class}">{section_html}</div>\n'
+        for section_html in sections
+    )
     
     # Create the HTML content
     extracted_html_content = f'''
@@ -173,8 +733,71 @@ def extract_html_content(extracted_html_file_path: str,html_content: str):
 </body>
 </html>
 '''
-    # Write the HTML content to a file
-    with open(extracted_html_file_path, "w") as f:
-        f.write(extracted_html_content)
+    return extracted_html_content
+
+
+def extract_marked_sections(html_content, heading_tag=SECTION_HEADING_TAG, marker_text=SECTION_MARKER_TEXT):
+    """
+    Return the markup of every heading-delimited section containing marker_text
+    
+    A section is a heading plus its following siblings up to the next
+    heading. Each parent is walked once, every node is serialized once and
+    the marker is searched in text nodes only, so the cost is linear in
+    the size of the document.
+    
+    Args:
+        html_content: HTML markup or an already parsed HtmlDocument
+        heading_tag: Tag that starts a new section
+        marker_text: Text that marks a section for extraction
+    """
+    document = as_html_document(html_content)
+    marker = _marker_pattern(marker_text)
+    headings = document.find_all(heading_tag)
+    
+    marked = {}
+    visited_parents = set()
+    for heading in headings:
+        parent = heading.parent
+        if parent is None or id(parent) in visited_parents:
+            continue
+        visited_parents.add(id(parent))
+        
+        # Partition this parent's children into sections in a single pass
+        section_heading = None
+        parts = []
+        found = False
+        for child in parent.children:
+            if child.name == heading_tag:
+                if found:
+                    marked[id(section_heading)] = ''.join(parts)
+                section_heading, parts, found = child, [], False
+            elif section_heading is None:
+                # Content before the first heading belongs to no section
+                continue
+            
+            parts.append(str(child))
+            if not found:
+                found = _contains_marker(child, marker)
+        
+        if found:
+            marked[id(section_heading)] = ''.join(parts)
+    
+    # Emit in document order of the headings
+    return [marked[id(heading)] for heading in headings if id(heading) in marked]
+
+
+@lru_cache(maxsize=32)
+def _marker_pattern(marker_text):
+    return re.compile(re.escape(marker_text))
+
 
-    return found_results
\ No newline at end of file
+def _contains_marker(element, marker):
+    """Search the element's visible text nodes for the marker"""
+    if isinstance(element, Tag):
+        # .strings already skips hidden text below the element, but not the element's own
+        if element.name in HIDDEN_TEXT_TAGS:
+            return False
+        return any(marker.search(text) for text in element.strings)
+    if isinstance(element, NavigableString) and not isinstance(element, PreformattedString):
+        return marker.search(element) is not None
+    return False
@@ -0,0 +1,224 @@
+import io
+import os
+import re
+from collections import deque
+
+from lxml import etree
+
+from services import HIDDEN_TEXT_TAGS
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_html_events(source, events=('start', 'end'), chunk_size=CHUNK_SIZE, encoding=None):
+    """
+    Feed an HTML source to lxml's pull parser chunk by chunk and yield its events
+
+    Args:
+        source: Markup (str or bytes), a readable file object or an os.PathLike file path
+        events: lxml event names to report
+        chunk_size: Number of bytes/characters fed to the parser at a time
+        encoding: Encoding of byte input, e.g. from uploads.sniff_encoding(); ignored for str
+    """
+    parser = None
+    stream, close_stream = open_html_source(source)
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if parser is None:
+                # Bytes are decoded by libxml2 as they are fed; str is already decoded
+                parser = etree.HTMLPullParser(
+                    events=events, encoding=encoding if isinstance(chunk, bytes) else None
+                )
+            if not chunk:
+                break
+            parser.feed(chunk)
+            yield from parser.read_events()
+    finally:
+        if close_stream:
+            stream.close()
+    parser.close()
+    yield from parser.read_events()
+
+
+def iter_marked_sections(source, heading_tag, marker_text, chunk_size=CHUNK_SIZE, encoding=None):
+    """
+    Streaming counterpart of services.extract_marked_sections
+
+    Sections (a heading plus its following siblings up to the next heading)
+    are yielded as markup in heading order as soon as they are complete.
+    Finished elements are removed from the tree, so memory stays bounded by
+    the largest section rather than by the size of the document.
+
+    Args:
+        heading_tag: Tag that starts a new section, e.g. services.SECTION_HEADING_TAG
+        marker_text: Text that marks a section, e.g. services.SECTION_MARKER_TEXT
+    """
+    marker = re.compile(re.escape(marker_text))
+    open_sections = {}   # parent element -> section currently collecting its children
+    pending = deque()    # sections in heading order, emitted once complete
+    member_stack = []    # for each open element: does it belong to a section of its parent?
+    finished = None      # last closed node; its tail text is only complete at the next event
+
+    def settle(node, section):
+        # Serialize the node into its section, then drop it unless an enclosing member still needs it
+        if section is not None:
+            section['parts'].append(etree.tostring(node, method='html', encoding='unicode', with_tail=True))
+            if not section['found']:
+                section['found'] = _contains_marker(node, marker)
+        if not any(member_stack):
+            parent = node.getparent()
+            if parent is not None:
+                parent.remove(node)
+
+    for event, element in iter_html_events(source, events=('start', 'end', 'comment'), chunk_size=chunk_size,
+                                            encoding=encoding):
+        if finished is not None:
+            settle(*finished)
+            finished = None
+
+        parent = element.getparent()
+
+        if event == 'start':
+            if element.tag == heading_tag and parent is not None:
+                # A heading closes the previous section of its parent and opens a new one
+                previous = open_sections.get(parent)
+                if previous is not None:
+                    previous['done'] = True
+                section = {'parts': [], 'found': False, 'done': False}
+                open_sections[parent] = section
+                pending.append(section)
+            member_stack.append(parent in open_sections)
+            continue
+
+        if event == 'end':
+            is_member = member_stack.pop()
+            # Sections of this element's own children end with it
+            closed = open_sections.pop(element, None)
+            if closed is not None:
+                closed['done'] = True
+        else:
+            # Comments are complete as soon as they are reported
+            is_member = parent in open_sections
+
+        finished = (element, open_sections.get(parent) if is_member else None)
+
+        while pending and pending[0]['done']:
+            done = pending.popleft()
+            if done['found']:
+                yield ''.join(done['parts'])
+
+    if finished is not None:
+        settle(*finished)
+    for section in pending:
+        if section['found']:
+            yield ''.join(section['parts'])
+
+
+def iter_table_rows(source, chunk_size=CHUNK_SIZE, encoding=None):
+    """
+    Yield the rows and header groups of every table as they are parsed
+
+    Rows of a nested table also belong to every enclosing table, and the
+    cells of a row include those of its nested tables, as with
+    extract_tables_from_html. A row is reported once it ends, so a row
+    holding a nested table comes after that table's rows; 'order' gives
+    the document order of the rows.
+
+    Yields:
+        Dicts with the indices of the enclosing 'tables', and either the
+        row's 'order', stripped 'cells' texts and whether it has 'th' cells,
+        or the 'thead' cell texts of the first thead of those tables
+    """
+    table_stack = []
+    table_count = 0
+    row_count = 0
+    row_stack = []       # document order number of every open row
+    thead_depth = 0
+    has_thead = set()    # tables whose first thead was seen; later ones are ignored
+    thead_tables = []    # for each open thead: the tables it is the first thead of
+
+    for event, element in iter_html_events(source, chunk_size=chunk_size, encoding=encoding):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'table':
+                table_stack.append(table_count)
+                table_count += 1
+            elif tag == 'tr' and table_stack:
+                # Rows are numbered by their start tags, i.e. in document order
+                row_stack.append(row_count)
+                row_count += 1
+            elif tag == 'thead':
+                tables = [table for table in table_stack if table not in has_thead]
+                has_thead.update(tables)
+                thead_tables.append(tables)
+                thead_depth += 1
+            continue
+
+        if tag == 'table':
+            table_stack.pop()
+            if table_stack:
+                # A nested table stays in its enclosing cell until that row is done
+                continue
+        elif tag == 'thead':
+            tables = thead_tables.pop()
+            thead_depth -= 1
+            if tables:
+                yield {'tables': tables, 'thead': [_text(cell) for cell in element.iter('td', 'th')]}
+            if table_stack:
+                continue
+        elif tag == 'tr' and table_stack:
+            cells = list(element.iter('td', 'th'))
+            yield {
+                'tables': list(table_stack),
+                'order': row_stack.pop(),
+                'cells': [_text(cell) for cell in cells],
+                'th': any(cell.tag == 'th' for cell in cells)
+            }
+            if row_stack or thead_depth:
+                # Still part of an enclosing row, or of a thead read when it ends
+                continue
+        elif table_stack:
+            # Cells and row groups are still needed until their row or table ends
+            continue
+
+        # Rows and everything outside tables are done with; free them
+        parent = element.getparent()
+        if parent is not None:
+            parent.remove(element)
+
+
+def open_html_source(source):
+    """Return (stream, close_when_done) for markup (str or bytes), a file object or an os.PathLike path"""
+    if isinstance(source, os.PathLike):
+        return open(source, 'rb'), True
+    if isinstance(source, str):
+        return io.StringIO(source), False
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source), False
+    return source, False
+
+
+def _contains_marker(element, marker):
+    """Search the element's visible text nodes (and its tail) for the marker"""
+    if any(marker.search(text) for text in _visible_texts(element)):
+        return True
+    return bool(element.tail and marker.search(element.tail))
+
+
+def _text(element):
+    """Stripped text content, joined like BeautifulSoup's get_text(strip=True)"""
+    return ''.join(text.strip() for text in _visible_texts(element))
+
+
+def _visible_texts(element):
+    """Text nodes below the element that get_text() reports, in document order (the element's tail excluded)"""
+    if not isinstance(element.tag, str) or element.tag in HIDDEN_TEXT_TAGS:
+        # Comments, processing instructions and hidden elements have no text of their own
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        yield from _visible_texts(child)
+        if child.tail:
+            yield child.tail
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from extraction import extract_outputs
+from services import SECTION_HEADING_TAG, SECTION_MARKER_TEXT
+
+OUTPUTS = ('images', 'tables')
+
+REPORT = f"""<!DOCTYPE html>
+<html><head><title>Report</title><style>.{SECTION_MARKER_TEXT} {{ }}</style></head>
+<body>
+<p>Intro before the first heading: {SECTION_MARKER_TEXT}</p>
+<{SECTION_HEADING_TAG}>Plain</{SECTION_HEADING_TAG}><p>{SECTION_MARKER_TEXT}</p><br>text &amp; tail
+<{SECTION_HEADING_TAG}>Script only</{SECTION_HEADING_TAG}><script>var marker = '{SECTION_MARKER_TEXT}';</script>
+<{SECTION_HEADING_TAG}>Style only</{SECTION_HEADING_TAG}><style>/* {SECTION_MARKER_TEXT} */</style>
+<{SECTION_HEADING_TAG}>Comment only</{SECTION_HEADING_TAG}><!-- {SECTION_MARKER_TEXT} -->
+<{SECTION_HEADING_TAG}>Ruby</{SECTION_HEADING_TAG}><ruby>x<rt>{SECTION_MARKER_TEXT}</rt></ruby>
+<{SECTION_HEADING_TAG}>Tail after script</{SECTION_HEADING_TAG}><script></script>{SECTION_MARKER_TEXT}
+<div>
+  <{SECTION_HEADING_TAG}>Nested</{SECTION_HEADING_TAG}><span>{SECTION_MARKER_TEXT}</span>
+  <{SECTION_HEADING_TAG}>Nested, unmarked</{SECTION_HEADING_TAG}><span>nothing</span>
+</div>
+<table>
+  <thead><tr><th>Name</th><th>Value</th></tr></thead>
+  <tr><td>a</td><td>1<script>ignored()</script></td></tr>
+  <tr><td>b</td><td><table><tr><th>inner</th><td>2</td></tr><tr><td>3</td><td>4</td></tr></table></td></tr>
+  <tr><td>c<!-- note --></td><td>5</td></tr>
+</table>
+<table>
+  <tr><th>H1</th><th>H2</th></tr>
+  <tr><td>x</td><td>y</td></tr>
+  <tr></tr>
+  <tr><td>only one</td></tr>
+</table>
+<table><caption><table><thead><tr><td>caption header</td></tr></thead><tr><td>z</td></tr></table></caption>
+  <tr><td>outer</td></tr>
+</table>
+<table></table>
+</body></html>
+"""
+
+
+def _normalized(sections):
+    """Section markup re-serialized by one parser, so both serializers compare equal"""
+    return [str(BeautifulSoup(section, 'lxml')) for section in sections]
+
+
+def _frames(data_sheets):
+    return [(title, header, [tuple(row) for row in rows]) for title, header, rows in data_sheets]
+
+
+class StreamingExtractionParityTest(unittest.TestCase):
+    """The streaming parser must extract exactly what the full parse tree does"""
+
+    def assert_same_outputs(self, source):
+        sections, data_sheets = extract_outputs(source, OUTPUTS)
+        streamed_sections, streamed_sheets = extract_outputs(source, OUTPUTS, streaming=True)
+        self.assertEqual(_normalized(streamed_sections), _normalized(sections))
+        self.assertEqual(_frames(streamed_sheets), _frames(data_sheets))
+        return sections, data_sheets
+
+    def test_markup(self):
+        sections, data_sheets = self.assert_same_outputs(REPORT)
+        self.assertEqual(len(sections), 3)
+        self.assertEqual(len(data_sheets), 5)
+
+    def test_bytes_and_path(self):
+        self.assert_same_outputs(REPORT.encode('utf-8'))
+        fd, path = tempfile.mkstemp(suffix='.html')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(REPORT)
+            self.assert_same_outputs(Path(path))
+        finally:
+            os.remove(path)
+
+    def test_markup_is_never_taken_for_a_path(self):
+        # No '<' in the first kilobyte used to make this a file name
+        sections, _ = self.assert_same_outputs(' ' * 2048 + REPORT)
+        self.assertEqual(len(sections), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import codecs
+import hashlib
+import io
+import os
+import posixpath
+import re
+import tempfile
+import zipfile
+from pathlib import Path
+
+# Bytes of an upload inspected for a byte order mark or <meta charset> (as in the HTML prescan)
+SNIFF_BYTES = 1024
+
+# Longest marks first, so UTF-32 LE is not mistaken for UTF-16 LE
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# Archive members treated as reports
+HTML_SUFFIXES = ('.html', '.htm')
+
+META_CHARSET_PATTERN = re.compile(
+    rb'<meta[^>]+?charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)',
+    re.IGNORECASE
+)
+
+
+class UploadTooLarge(Exception):
+    """Raised while spooling an upload that exceeds the size limit"""
+
+
+def sniff_encoding(head, default='utf-8'):
+    """
+    Encoding of an HTML document from its first bytes
+
+    A byte order mark wins, then a <meta charset> / http-equiv declaration;
+    anything unknown falls back to `default`.
+    """
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if head.startswith(mark):
+            return encoding
+    match = META_CHARSET_PATTERN.search(head[:SNIFF_BYTES])
+    if match:
+        # Keep the declared label: libxml2 (iconv) knows 'euc-jp', not Python's canonical 'euc_jp'
+        label = match.group(1).decode('ascii').lower()
+        try:
+            codecs.lookup(label)
+            return label
+        except LookupError:
+            pass
+    return default
+
+
+class SpooledUpload:
+    """
+    An uploaded HTML file copied out of the request as raw bytes
+
+    The stream is read in chunks while it is hashed and measured; it stays
+    in memory up to `spool_bytes` and is moved to a temporary file beyond
+    that, so it outlives the request (for queued jobs) without ever being
+    decoded into one large str. Parsers receive source(): the bytes, or the
+    temp file path, plus the sniffed encoding.
+
+    Args:
+        stream: Readable binary stream, e.g. the request's FileStorage.stream
+        filename: Name of the uploaded file
+        spool_bytes: Largest upload kept in memory
+        max_bytes: Raise UploadTooLarge beyond this size, or None
+        chunk_size: Bytes copied at a time
+    """
+
+    def __init__(self, stream, filename, spool_bytes=1024 * 1024, max_bytes=None, chunk_size=64 * 1024):
+        self.filename = filename
+        self.size = 0
+        self.path = None
+        self._data = bytearray()
+        self._file = None
+        digest = hashlib.sha256()
+
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                self.size += len(chunk)
+                if max_bytes is not None and self.size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                if self._file is None and len(self._data) + len(chunk) > spool_bytes:
+                    self._spill()
+                if self._file is not None:
+                    self._file.write(chunk)
+                else:
+                    self._data += chunk
+        except BaseException:
+            self.close()
+            raise
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            with open(self.path, 'rb') as f:
+                head = f.read(SNIFF_BYTES)
+        else:
+            self._data = bytes(self._data)
+            head = self._data[:SNIFF_BYTES]
+        self.content_hash = digest.hexdigest()
+        self.encoding = sniff_encoding(head)
+
+    @property
+    def spooled(self):
+        """True once the upload lives in a temp file rather than in memory"""
+        return self.path is not None
+
+    def source(self):
+        """What the parsers read: the raw bytes, or the path of the temp file (a pathlib.Path)"""
+        return Path(self.path) if self.spooled else self._data
+
+    def open(self):
+        """Binary stream over the upload's bytes"""
+        if self.spooled:
+            return open(self.path, 'rb')
+        return io.BytesIO(self._data)
+
+    def close(self):
+        """Delete the temp file, if any; safe to call more than once"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self._data = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _spill(self):
+        fd, self.path = tempfile.mkstemp(prefix='html2excel_upload_', suffix='.html')
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write(self._data)
+        self._data = bytearray()
+
+
+def read_html_archive(stream, spool_bytes=1024 * 1024, max_bytes=None, max_files=None):
+    """
+    SpooledUploads for the HTML files in a zip archive, in archive order
+
+    Members are decompressed chunk by chunk, so max_bytes bounds what is
+    actually extracted rather than what the archive claims.
+
+    Args:
+        stream: Seekable binary stream holding the zip archive
+        spool_bytes: Largest member kept in memory
+        max_bytes: Raise UploadTooLarge once the members add up to more, or None
+        max_files: Raise ValueError beyond this many HTML members, or None
+
+    Raises:
+        UploadTooLarge: When the extracted members exceed max_bytes
+        ValueError: When the stream is not a zip archive or holds too many reports
+    """
+    uploads = []
+    try:
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Not a valid zip archive: {str(e)}")
+        with archive:
+            for info in archive.infolist():
+                name = posixpath.basename(info.filename)
+                # Skip folders and the resource forks macOS adds to archives
+                if info.is_dir() or name.startswith('._') or not name.lower().endswith(HTML_SUFFIXES):
+                    continue
+                if max_files is not None and len(uploads) >= max_files:
+                    raise ValueError(f"Archive holds more than {max_files} HTML files")
+                remaining = None if max_bytes is None else max_bytes - sum(upload.size for upload in uploads)
+                with archive.open(info) as member:
+                    uploads.append(SpooledUpload(member, name, spool_bytes=spool_bytes, max_bytes=remaining))
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    return uploads
@@ -0,0 +1,53 @@
+"""
+Per-element vs batched screenshot capture across box counts
+
+Renders the extracted 'Uncovered Link' document of a synthetic report in
+one headless Chromium and times capture_box_images in both modes.
+Requires the Playwright browsers (python -m playwright install chromium).
+
+    python benchmarks/bench_capture.py --boxes 10 50 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from playwright.sync_api import sync_playwright
+
+from services import build_extracted_html, capture_box_images
+from synthetic_report import generate_report
+
+CAPTURE_MODES = ('element', 'batch')
+
+
+def measure(page, mode, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        images = capture_box_images(page, '.image-box', mode)
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(images)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--boxes', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        page = browser.new_page()
+        for boxes in args.boxes:
+            page.set_content(build_extracted_html(generate_report(sections=boxes, uncovered_ratio=1.0)))
+            for mode in CAPTURE_MODES:
+                best, count = measure(page, mode, args.repeat)
+                results.append((boxes, mode, best, count))
+        browser.close()
+
+    print(f"{'boxes':>6} {'mode':>8} {'best s':>8} {'ms/box':>8}")
+    for boxes, mode, best, count in results:
+        print(f"{boxes:>6} {mode:>8} {best:>8.3f} {best * 1000 / max(count, 1):>8.1f}")
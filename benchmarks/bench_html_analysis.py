@@ -0,0 +1,66 @@
+"""
+Parse time and peak memory of the HTML analysis stage
+
+'per-extractor' reproduces the old behaviour: the upload is parsed with
+html.parser once for each of the four extractors. 'shared' is the current
+pipeline: one lxml HtmlDocument walked once and read by all extractors.
+
+    python benchmarks/bench_html_analysis.py --sections 200 2000 10000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from extraction import extract_meta_information, extract_tables_from_html, extract_text_content
+from html_analysis import HtmlDocument
+from services import build_extracted_html
+from synthetic_report import generate_report
+
+EXTRACTORS = (extract_tables_from_html, extract_text_content, extract_meta_information, build_extracted_html)
+
+
+def run_per_extractor(html_content):
+    for extractor in EXTRACTORS:
+        document = HtmlDocument(html_content, parser='html.parser')
+        extractor(document)
+        document.decompose()
+
+
+def run_shared(html_content):
+    document = HtmlDocument(html_content)
+    for extractor in EXTRACTORS:
+        extractor(document)
+    document.decompose()
+
+
+def measure(fn, html_content, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html_content)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(html_content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sections', type=int, nargs='+', default=[200, 2000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'sections':>8} {'size MB':>8} {'mode':>14} {'best s':>8} {'peak MB':>8}")
+    for sections in args.sections:
+        html_content = generate_report(sections=sections, tables=max(1, sections // 10))
+        size_mb = len(html_content.encode('utf-8')) / (1024 * 1024)
+        for name, fn in (('per-extractor', run_per_extractor), ('shared', run_shared)):
+            best, peak = measure(fn, html_content, args.repeat)
+            print(f"{sections:>8} {size_mb:>8.2f} {name:>14} {best:>8.3f} {peak / (1024 * 1024):>8.1f}")
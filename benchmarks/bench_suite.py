@@ -0,0 +1,275 @@
+"""
+Stage-by-stage benchmark of the conversion pipeline on synthetic reports
+
+For every report size it times the pipeline stages (full parse, the three
+extractors, extract_html_content, rendering, workbook save) and the whole
+/process endpoint, and writes latency percentiles, throughput and peak RSS
+to a JSON file. Commit the file or keep it as a CI artifact, then compare
+two runs:
+
+    python benchmarks/bench_suite.py --sections 100 1000 --output bench.json
+    python benchmarks/bench_suite.py --compare base.json bench.json
+
+/process runs in-process through Flask's test client unless --url points at
+a running server. Rendering needs the Playwright browsers; without them the
+'render' and image 'process' stages record an error instead of timings.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from PIL import Image
+
+from browser_pool import BrowserPool
+from extraction import extract_meta_information, extract_tables_from_html, extract_text_content
+from html_analysis import HtmlDocument
+from load_test import encode_upload, percentile, post
+from services import build_workbook, capture_sections_images, extract_html_content, extract_marked_sections
+from synthetic_report import generate_report
+
+STAGES = ('parse', 'tables', 'text', 'meta', 'extract_html_content', 'render', 'save', 'process')
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark for this process (Linux); False where unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in KB on Linux and never goes down
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summarize(samples, elapsed=None, count=None):
+    """Latency percentiles (seconds) and throughput (operations per second) of a list of timings"""
+    summary = {
+        'samples': len(samples),
+        'min': round(min(samples), 6),
+        'mean': round(sum(samples) / len(samples), 6),
+        'max': round(max(samples), 6),
+        'throughput_per_s': round((count or len(samples)) / (elapsed or sum(samples)), 3)
+    }
+    for share in PERCENTILES:
+        summary[f'p{int(share * 100)}'] = round(percentile(samples, share), 6)
+    return summary
+
+
+def measure(fn, repeat):
+    """Run fn() `repeat` times; timings summary plus the peak RSS reached meanwhile"""
+    exact_peak = reset_peak_rss()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    result = summarize(samples)
+    result['peak_rss_mb'] = round(peak_rss() / (1024 * 1024), 1)
+    if not exact_peak:
+        result['peak_rss_note'] = 'process-wide high-water mark'
+    return result
+
+
+def placeholder_images(count, width=600, height=120):
+    """PNG images shaped like box screenshots, for timing the save without a browser"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (255, 255, 255)).save(buffer, 'PNG')
+    png = buffer.getvalue()
+    return [{'png': png, 'width': width, 'height': height} for _ in range(count)]
+
+
+def describe(stats):
+    """One-line console summary of a stage result"""
+    if 'error' in stats:
+        return f"failed: {stats['error']}"
+    return (f"p50 {stats['p50']:.4f}s  p95 {stats['p95']:.4f}s  {stats['throughput_per_s']:.2f}/s  "
+            f"peak RSS {stats.get('peak_rss_mb', '-')} MB")
+
+
+def run_process(html_content, args, in_process_app):
+    """Time the whole /process endpoint; every request carries distinct content so no cache answers it"""
+    uploads = [encode_upload(html_content + f'<!-- bench {time.time_ns()} {i} -->', args.outputs)
+               for i in range(args.process_requests)]
+
+    if args.url:
+        def send(upload):
+            return post(args.url, *upload, args.timeout)
+    else:
+        def send(upload):
+            body, content_type = upload
+            start = time.perf_counter()
+            response = in_process_app.test_client().post('/process', data=body, content_type=content_type)
+            response.get_data()
+            return response.status_code, time.perf_counter() - start
+
+    exact_peak = reset_peak_rss()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(send, uploads))
+    elapsed = time.perf_counter() - start
+
+    latencies = [seconds for status, seconds in results if status == 200]
+    if not latencies:
+        return {'error': f"no successful requests (status codes {sorted(set(s for s, _ in results))})"}
+    result = summarize(latencies, elapsed=elapsed)
+    result.update(concurrency=args.concurrency, failed=len(results) - len(latencies))
+    if not args.url:
+        # Only meaningful when the server runs in this process
+        result['peak_rss_mb'] = round(peak_rss() / (1024 * 1024), 1)
+        if not exact_peak:
+            result['peak_rss_note'] = 'process-wide high-water mark'
+    return result
+
+
+def run_scale(sections, args, browser_pool, in_process_app):
+    html_content = generate_report(sections=sections, uncovered_ratio=args.uncovered_ratio,
+                                   tables=max(1, int(sections * args.table_ratio)), section_size=args.section_size,
+                                   seed=args.seed)
+    document = HtmlDocument(html_content)
+    boxes = extract_marked_sections(document)
+    data_sheets = [('Text Content', ['Element', 'Content'], extract_text_content(document))]
+    entry = {'sections': sections, 'size_bytes': len(html_content.encode('utf-8')), 'boxes': len(boxes), 'stages': {}}
+    stages = entry['stages']
+    print(f"📄 {sections} sections, {entry['size_bytes'] / 1024:.0f} KB, {len(boxes)} boxes")
+
+    def stage(name, fn):
+        if name not in args.stages:
+            return
+        try:
+            stages[name] = measure(fn, args.repeat)
+        except Exception as e:
+            stages[name] = {'error': str(e).strip().splitlines()[0]}
+        print(f"  {name:<22} {describe(stages[name])}")
+
+    stage('parse', lambda: HtmlDocument(html_content))
+    stage('tables', lambda: extract_tables_from_html(document))
+    stage('text', lambda: extract_text_content(document))
+    stage('meta', lambda: extract_meta_information(document))
+    with tempfile.TemporaryDirectory() as directory:
+        stage('extract_html_content', lambda: extract_html_content(os.path.join(directory, 'extracted.html'),
+                                                                   html_content))
+
+    images = None
+    if 'render' in args.stages:
+        rendered = []
+        stage('render', lambda: rendered.append(
+            capture_sections_images(boxes, browser_pool=browser_pool, capture_mode=args.capture_mode)))
+        images = rendered[-1] if rendered else None
+    # Without a browser the save is timed with placeholder screenshots of the same count
+    stage('save', lambda: build_workbook(io.BytesIO(), images or placeholder_images(len(boxes)), data_sheets))
+
+    if 'process' in args.stages:
+        try:
+            stages['process'] = run_process(html_content, args, in_process_app)
+        except Exception as e:
+            stages['process'] = {'error': str(e).strip().splitlines()[0]}
+        print(f"  {'process':<22} {describe(stages['process'])}")
+    return entry
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def compare(base_path, new_path):
+    """Print the p50/p95 latency and peak RSS change of every stage between two result files"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    base_results = {entry['sections']: entry['stages'] for entry in base['results']}
+    print(f"{'sections':>8} {'stage':<22} {'p50 base':>9} {'p50 new':>9} {'change':>8} {'p95 change':>10} "
+          f"{'RSS MB':>8}")
+    for entry in new['results']:
+        for name, stats in entry['stages'].items():
+            old = base_results.get(entry['sections'], {}).get(name)
+            if not old or 'p50' not in old or 'p50' not in stats:
+                continue
+            p50 = (stats['p50'] - old['p50']) / old['p50'] * 100 if old['p50'] else 0.0
+            p95 = (stats['p95'] - old['p95']) / old['p95'] * 100 if old['p95'] else 0.0
+            rss = stats.get('peak_rss_mb', 0) - old.get('peak_rss_mb', 0)
+            print(f"{entry['sections']:>8} {name:<22} {old['p50']:>9.4f} {stats['p50']:>9.4f} {p50:>+7.1f}% "
+                  f"{p95:>+9.1f}% {rss:>+8.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sections', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--uncovered-ratio', type=float, default=0.3)
+    parser.add_argument('--table-ratio', type=float, default=0.1, help='Share of sections carrying a table')
+    parser.add_argument('--section-size', type=int, default=5, help='Paragraphs per section')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per stage')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--capture-mode', choices=('batch', 'element'), default='batch')
+    parser.add_argument('--outputs', default='images', help='Outputs requested from /process')
+    parser.add_argument('--process-requests', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--url', help='Benchmark a running server, e.g. http://localhost:5000/process')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='Compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    browser_pool = BrowserPool(size=1) if 'render' in args.stages else None
+    backend = None
+    if 'process' in args.stages and not args.url:
+        import html2image2excel_backend as backend
+        # Every request should render: take the screenshot cache out of the measurement
+        backend.section_image_cache = None
+
+    try:
+        results = [run_scale(sections, args, browser_pool, backend and backend.app) for sections in args.sections]
+    finally:
+        if browser_pool is not None:
+            browser_pool.shutdown()
+        if backend is not None:
+            backend.stop_services()
+
+    report = {
+        'environment': environment(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"💾 Results written to {args.output}")
@@ -0,0 +1,77 @@
+"""
+Concurrent upload load generator for a running backend
+
+Posts the same synthetic report to /process from several client threads
+and reports throughput and latency. Start the server first, e.g.
+`gunicorn -c gunicorn.conf.py` or `python html2image2excel_backend.py`.
+
+    python benchmarks/load_test.py --requests 40 --concurrency 8 --outputs tables
+"""
+import argparse
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from synthetic_report import generate_report
+
+
+def encode_upload(html_content, outputs):
+    """multipart/form-data body and content type for an html_file upload"""
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="outputs"\r\n\r\n{outputs}\r\n'
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="html_file"; filename="report.html"\r\n'
+        f'Content-Type: text/html\r\n\r\n'
+    ).encode('utf-8') + html_content.encode('utf-8') + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def post(url, body, content_type, timeout):
+    """One upload; returns (HTTP status, seconds)"""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000/process')
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--sections', type=int, default=200)
+    parser.add_argument('--outputs', default='images')
+    parser.add_argument('--timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    # A distinct comment per request keeps the server's result cache out of the measurement
+    report = generate_report(sections=args.sections)
+    uploads = [encode_upload(report + f'<!-- {i} -->', args.outputs) for i in range(args.requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda upload: post(args.url, *upload, args.timeout), uploads))
+    elapsed = time.perf_counter() - start
+
+    latencies = [seconds for status, seconds in results if status == 200]
+    failed = len(results) - len(latencies)
+    print(f"{len(results)} requests, concurrency {args.concurrency}, {len(uploads[0][0]) // 1024} KB each")
+    print(f"throughput: {len(latencies) / elapsed:.2f} req/s ({failed} failed)")
+    if latencies:
+        print(f"latency s: p50 {percentile(latencies, 0.5):.2f}  p95 {percentile(latencies, 0.95):.2f}  "
+              f"max {max(latencies):.2f}")
@@ -0,0 +1,66 @@
+"""
+Synthetic coverage reports shaped like originalHTML.html
+
+Each report is a flat sequence of h4-delimited sections; a configurable
+share of them contains the 'Uncovered Link' marker, and tables can be
+sprinkled in so the table extractor has work to do.
+"""
+import argparse
+import random
+
+
+def generate_report(sections=100, uncovered_ratio=0.3, tables=10, section_size=5, table_rows=20, seed=0):
+    """
+    Build a synthetic HTML report
+
+    Args:
+        sections: Number of h4 sections
+        uncovered_ratio: Share of sections that contain 'Uncovered Link'
+        tables: Number of sections that also carry a table
+        section_size: Paragraphs per section
+        table_rows: Rows per table
+        seed: Random seed so reports are reproducible
+    """
+    rng = random.Random(seed)
+    uncovered = set(rng.sample(range(sections), int(sections * uncovered_ratio)))
+    with_table = set(rng.sample(range(sections), min(tables, sections)))
+
+    parts = [
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n'
+        '    <meta charset="UTF-8">\n'
+        '    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+        '    <meta name="generator" content="synthetic-coverage-report">\n'
+        '    <title>Coverage Report</title>\n'
+        '</head>\n<body>\n'
+    ]
+    for i in range(sections):
+        parts.append(f'    <h4>Module{i+1}</h4>\n')
+        for j in range(section_size):
+            if i in uncovered and j == 0:
+                parts.append(f'    <p><div>Uncovered Link module{i+1}/path_{j}</div></p>\n')
+            else:
+                parts.append(f'    <p>Line {j+1} of module {i+1}: <a href="https://example.com/m{i+1}/{j}">covered</a></p>\n')
+        if i in with_table:
+            parts.append('    <table>\n        <thead><tr><th>File</th><th>Lines</th><th>Covered</th></tr></thead>\n')
+            for r in range(table_rows):
+                parts.append(f'        <tr><td>file_{r}.py</td><td>{rng.randint(10, 500)}</td>'
+                             f'<td>{rng.randint(0, 100)}%</td></tr>\n')
+            parts.append('    </table>\n')
+        if i % 10 == 0:
+            parts.append(f'    <ul><li>Owner {i}</li><li>Build {rng.randint(1, 9999)}</li></ul>\n')
+    parts.append('</body>\n</html>\n')
+    return ''.join(parts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic coverage report')
+    parser.add_argument('output', help='Output HTML file')
+    parser.add_argument('--sections', type=int, default=100)
+    parser.add_argument('--uncovered-ratio', type=float, default=0.3)
+    parser.add_argument('--tables', type=int, default=10)
+    parser.add_argument('--section-size', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(generate_report(args.sections, args.uncovered_ratio, args.tables, args.section_size, seed=args.seed))